@@ -1,40 +1,126 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, File, UploadFile
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status, File, UploadFile
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import JSONResponse
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
+import calendar
 import os
 import logging
+import math
+import re
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 import bcrypt
+import csv
+import difflib
+import hashlib
+import ipaddress
 import jwt
+import numpy as np
 from decimal import Decimal
 import shutil
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
 
 # JWT Configuration
-JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 
-# Create the main app
-app = FastAPI()
+RECURRING_FREQUENCIES = ('daily', 'weekly', 'monthly')
+WORKER_ID = str(uuid.uuid4())
+
+# Budget alerts fire once per budget period when spending crosses these percentages
+BUDGET_ALERT_THRESHOLDS = (80, 100)
+# Transactions stamped with their owner's current totals epoch are already in
+# the budget running totals; users start at this epoch and get a new one when
+# their base currency changes
+INITIAL_TOTALS_EPOCH = '0'
+
+# FX rates: CSV of date,currency,rate quoted as units of currency per one FX_QUOTE_CURRENCY
+DEFAULT_FX_RATES_PATH = ROOT_DIR / 'fx_rates.csv'
+FX_QUOTE_CURRENCY = 'USD'
+DEFAULT_CURRENCY = 'USD'
+
+# Near-duplicate search results are capped per request
+DUPLICATE_RESULT_LIMIT = 500
+
+# Rate limiting: token cost per route (default 1); auth routes are keyed by client IP
+ROUTE_COSTS = {
+    "/api/reports/monthly": 10,
+    "/api/reports/summary": 5,
+    "/api/transactions/duplicates": 10,
+    "/api/upload": 3,
+}
+AUTH_ROUTES = ("/api/auth/login", "/api/auth/register")
+RATE_LIMIT_MAX_KEYS = 100000
+
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
-# Upload directory
-UPLOAD_DIR = ROOT_DIR / 'uploads'
-UPLOAD_DIR.mkdir(exist_ok=True)
+# ============= SETTINGS =============
+
+class Settings(BaseModel):
+    mongo_url: str
+    db_name: str
+    jwt_secret: str = 'your-secret-key-change-in-production'
+    cors_origins: List[str] = ['*']
+    upload_dir: Path = ROOT_DIR / 'uploads'
+    
+    # Motor pool; min_pool_size connections are opened during startup
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 10
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_connect_timeout_ms: int = 5000
+    
+    # Recurring scheduler, archiver and fingerprint backfill
+    background_tasks: bool = True
+    recurring_interval_seconds: int = 60
+    recurring_batch_size: int = 500
+    fx_rates_path: Path = DEFAULT_FX_RATES_PATH
+    
+    # Cold history: transactions older than archive_after_days move to per-user, per-year Parquet files
+    archive_dir: Path = ROOT_DIR / 'archive'
+    archive_after_days: int = 730
+    archive_interval_seconds: int = 86400
+    
+    # Token buckets per user (per IP on auth routes) and a per-worker in-flight cap
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = 'memory'  # 'memory' or 'mongo' to share buckets across workers
+    rate_limit_capacity: float = 60
+    rate_limit_refill_per_second: float = 1
+    auth_rate_limit_capacity: float = 10
+    auth_rate_limit_refill_per_second: float = 0.1
+    max_concurrent_requests: int = 200
+    # Proxies (IPs or CIDRs) whose X-Forwarded-For is believed when keying buckets
+    trusted_proxies: List[str] = []
+    
+    @classmethod
+    def from_env(cls) -> 'Settings':
+        # Every field can be set through its upper-cased name, e.g. MONGO_URL
+        load_dotenv(ROOT_DIR / '.env')
+        values = {name: os.environ[name.upper()] for name in cls.model_fields if name.upper() in os.environ}
+        for name in ('cors_origins', 'trusted_proxies'):
+            if name in values:
+                values[name] = [v.strip() for v in values[name].split(',') if v.strip()]
+        return cls(**values)
+
+def get_settings(request: Request) -> Settings:
+    return request.app.state.settings
+
+def get_db(request: Request) -> AsyncIOMotorDatabase:
+    return request.app.state.db
+
+def get_fx_rates(request: Request) -> 'FxRates':
+    return request.app.state.fx_rates
 
 # ============= MODELS =============
 
@@ -43,12 +129,18 @@ class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: EmailStr
     name: str
+    base_currency: str = DEFAULT_CURRENCY
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class UserCreate(BaseModel):
     email: EmailStr
     name: str
     password: str
+    base_currency: str = DEFAULT_CURRENCY
+
+class UserUpdate(BaseModel):
+    name: Optional[str] = None
+    base_currency: Optional[str] = None
 
 class UserLogin(BaseModel):
     email: EmailStr
@@ -64,15 +156,19 @@ class Transaction(BaseModel):
     user_id: str
     type: str  # 'income' or 'expense'
     amount: float
+    currency: str = DEFAULT_CURRENCY
     category: str
     description: str
     date: str
     receipt_url: Optional[str] = None
+    recurring_rule_id: Optional[str] = None
+    archived: bool = False  # archived rows are read-only
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class TransactionCreate(BaseModel):
     type: str
     amount: float
+    currency: Optional[str] = None  # defaults to the user's base currency
     category: str
     description: str
     date: str
@@ -93,6 +189,47 @@ class BudgetCreate(BaseModel):
     category: str
     amount: float
 
+class RecurringRule(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    type: str  # 'income' or 'expense'
+    amount: float
+    currency: str = DEFAULT_CURRENCY
+    category: str
+    description: str
+    frequency: str  # 'daily', 'weekly' or 'monthly'
+    interval: int = 1
+    start_date: str
+    end_date: Optional[str] = None
+    next_run: Optional[str] = None  # date of the next occurrence to materialize
+    active: bool = True
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class RecurringRuleCreate(BaseModel):
+    type: str
+    amount: float
+    currency: Optional[str] = None
+    category: str
+    description: str
+    frequency: str
+    interval: int = 1
+    start_date: str
+    end_date: Optional[str] = None
+
+class BudgetAlert(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    budget_id: str
+    month: int
+    year: int
+    category: str
+    threshold: int  # percentage of the budget amount
+    spent: float
+    budget_amount: float
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
 # ============= AUTH HELPERS =============
 
 def hash_password(password: str) -> str:
@@ -101,30 +238,182 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-def create_token(user_id: str) -> str:
-    return jwt.encode({'user_id': user_id}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+def create_token(user_id: str, secret: str) -> str:
+    return jwt.encode({'user_id': user_id}, secret, algorithm=JWT_ALGORITHM)
 
-def decode_token(token: str) -> str:
+def decode_token(token: str, secret: str) -> str:
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(token, secret, algorithms=[JWT_ALGORITHM])
         return payload['user_id']
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail='Invalid token')
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    return decode_token(credentials.credentials)
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+    return decode_token(credentials.credentials, request.app.state.settings.jwt_secret)
+
+# ============= CURRENCY HELPERS =============
+
+class FxRates:
+    """Dated FX table indexed by currency, with as-of lookups by date."""
+    
+    def __init__(self, rates: dict):
+        # currency -> (sorted datetime64 dates, rates per quote currency unit)
+        self.rates = rates
+    
+    @classmethod
+    def load(cls, path: Path) -> 'FxRates':
+        rows = {}
+        if path.exists():
+            with open(path, newline='') as f:
+                for row in csv.DictReader(f):
+                    rows.setdefault(row['currency'].strip().upper(), []).append((row['date'].strip(), float(row['rate'])))
+        else:
+            logger.warning(f"FX rates file {path} not found; only {FX_QUOTE_CURRENCY} is supported")
+        
+        rates = {}
+        for currency, points in rows.items():
+            points.sort()
+            rates[currency] = (
+                np.array([p[0] for p in points], dtype='datetime64[D]'),
+                np.array([p[1] for p in points], dtype=np.float64)
+            )
+        return cls(rates)
+    
+    def supports(self, currency: str) -> bool:
+        return currency == FX_QUOTE_CURRENCY or currency in self.rates
+    
+    def rates_for(self, currency: str, dates: np.ndarray) -> np.ndarray:
+        if currency == FX_QUOTE_CURRENCY:
+            return np.ones(len(dates))
+        rate_dates, rates = self.rates[currency]
+        # Latest rate on or before each date; earlier dates use the first rate
+        idx = np.searchsorted(rate_dates, dates, side='right') - 1
+        return rates[np.clip(idx, 0, len(rates) - 1)]
+    
+    def convert(self, amounts: np.ndarray, currencies: np.ndarray, dates: np.ndarray, base_currency: str) -> np.ndarray:
+        # Cross rate through the quote currency: base units per source unit.
+        # Currencies missing from the table (e.g. dropped from a reloaded
+        # file) come back as NaN for the caller to handle
+        factors = np.full(len(amounts), np.nan)
+        for currency in np.unique(currencies):
+            mask = currencies == currency
+            if currency == base_currency:
+                factors[mask] = 1.0
+            elif self.supports(currency) and self.supports(base_currency):
+                factors[mask] = self.rates_for(base_currency, dates[mask]) / self.rates_for(currency, dates[mask])
+        return amounts * factors
+
+def parse_dates(date_strs: List[str]) -> np.ndarray:
+    try:
+        return np.array(date_strs, dtype='datetime64[D]')
+    except ValueError:
+        # Free-form legacy dates become NaT, which resolves to the latest rate
+        parsed = []
+        for d in date_strs:
+            try:
+                parsed.append(np.datetime64(d, 'D'))
+            except ValueError:
+                parsed.append(np.datetime64('NaT'))
+        return np.array(parsed, dtype='datetime64[D]')
+
+def normalize_currency(fx: FxRates, currency: str) -> str:
+    currency = currency.strip().upper()
+    if not fx.supports(currency):
+        raise HTTPException(status_code=400, detail=f"Unsupported currency: {currency}")
+    return currency
+
+def to_base_currency(fx: FxRates, amount: float, currency: str, date_str: str, base_currency: str) -> float:
+    if currency == base_currency:
+        return amount
+    converted = float(fx.convert(
+        np.array([amount], dtype=np.float64),
+        np.array([currency]),
+        parse_dates([date_str]),
+        base_currency
+    )[0])
+    if math.isnan(converted):
+        # Left out of the budget totals, the same way reports skip the row
+        logger.warning(f"No FX rates for {currency} -> {base_currency}, amount left out of totals")
+        return 0.0
+    return converted
+
+async def get_base_currency(db: AsyncIOMotorDatabase, user_id: str) -> str:
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "base_currency": 1})
+    return (user or {}).get('base_currency', DEFAULT_CURRENCY)
+
+async def get_totals_basis(db: AsyncIOMotorDatabase, user_id: str) -> tuple:
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "base_currency": 1, "totals_epoch": 1}) or {}
+    return user.get('base_currency', DEFAULT_CURRENCY), user.get('totals_epoch', INITIAL_TOTALS_EPOCH)
+
+async def aggregate_in_base(db: AsyncIOMotorDatabase, fx: FxRates, match: dict, keys: List[str], base_currency: str, archived=None) -> tuple:
+    # Mongo collapses rows to one per key/currency/date, then the groups are
+    # converted in a single vectorized pass instead of row by row
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                **{k: f"${k}" for k in keys},
+                "date": "$date",
+                "currency": {"$ifNull": ["$currency", base_currency]}
+            },
+            "amount": {"$sum": "$amount"}
+        }}
+    ]
+    groups = await db.transactions.aggregate(pipeline).to_list(None)
+    ids = [g['_id'] for g in groups]
+    sums = [g['amount'] for g in groups]
+    
+    if archived is not None:
+        archived_ids, archived_sums = archive_groups(archived, keys)
+        ids += archived_ids
+        sums += archived_sums
+    return convert_groups(fx, ids, sums, base_currency)
+
+def archive_groups(archived, keys: List[str]) -> tuple:
+    # Archived rows (a pyarrow table) are grouped like the Mongo pipeline does
+    if not archived.num_rows:
+        return [], []
+    group_keys = keys + ["date", "currency"]
+    rows = archived.group_by(group_keys).aggregate([("amount", "sum")]).to_pylist()
+    return [{k: row[k] for k in group_keys} for row in rows], [row['amount_sum'] for row in rows]
+
+def convert_groups(fx: FxRates, ids: List[dict], sums: List[float], base_currency: str) -> tuple:
+    amounts = fx.convert(
+        np.array(sums, dtype=np.float64),
+        np.array([i['currency'] for i in ids], dtype=object),
+        parse_dates([i['date'] for i in ids]),
+        base_currency
+    )
+    
+    # Groups in currencies without rates are skipped and reported back
+    converted = ~np.isnan(amounts)
+    unconverted = sorted({ids[i]['currency'] for i in np.flatnonzero(~converted)})
+    if unconverted:
+        logger.warning(f"No FX rates for {', '.join(unconverted)} -> {base_currency}, rows left out of totals")
+    return [i for i, ok in zip(ids, converted) if ok], amounts[converted], unconverted
+
+# ============= HEALTH ROUTE =============
+
+@api_router.get("/health")
+async def health(db: AsyncIOMotorDatabase = Depends(get_db)):
+    await db.command('ping')
+    return {"status": "ok"}
 
 # ============= AUTH ROUTES =============
 
 @api_router.post("/auth/register", response_model=Token)
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), fx: FxRates = Depends(get_fx_rates)):
     # Check if user exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user
-    user = User(email=user_data.email, name=user_data.name)
+    user = User(
+        email=user_data.email,
+        name=user_data.name,
+        base_currency=normalize_currency(fx, user_data.base_currency)
+    )
     user_dict = user.model_dump()
     user_dict['password_hash'] = hash_password(user_data.password)
     user_dict['created_at'] = user_dict['created_at'].isoformat()
@@ -132,11 +421,11 @@ async def register(user_data: UserCreate):
     await db.users.insert_one(user_dict)
     
     # Create token
-    token = create_token(user.id)
+    token = create_token(user.id, settings.jwt_secret)
     return Token(token=token, user=user)
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(login_data: UserLogin):
+async def login(login_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings)):
     # Find user
     user_dict = await db.users.find_one({"email": login_data.email})
     if not user_dict or not verify_password(login_data.password, user_dict['password_hash']):
@@ -147,11 +436,11 @@ async def login(login_data: UserLogin):
         user_dict['created_at'] = datetime.fromisoformat(user_dict['created_at'])
     
     user = User(**user_dict)
-    token = create_token(user.id)
+    token = create_token(user.id, settings.jwt_secret)
     return Token(token=token, user=user)
 
 @api_router.get("/auth/me", response_model=User)
-async def get_me(user_id: str = Depends(get_current_user)):
+async def get_me(user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
     user_dict = await db.users.find_one({"id": user_id})
     if not user_dict:
         raise HTTPException(status_code=404, detail="User not found")
@@ -161,34 +450,337 @@ async def get_me(user_id: str = Depends(get_current_user)):
     
     return User(**user_dict)
 
+@api_router.put("/auth/me", response_model=User)
+async def update_me(user_data: UserUpdate, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), fx: FxRates = Depends(get_fx_rates)):
+    existing = await db.users.find_one({"id": user_id}, {"_id": 0})
+    if not existing:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    update_data = {k: v for k, v in user_data.model_dump().items() if v is not None}
+    if 'base_currency' in update_data:
+        update_data['base_currency'] = normalize_currency(fx, update_data['base_currency'])
+    
+    # Budget running totals are kept in the base currency, so a change starts
+    # a new totals epoch: every existing transaction counts as not yet in the
+    # totals, and the totals are reseeded from zero. Writes racing the switch
+    # itself can be off by their own amount
+    previous_currency = existing.get('base_currency', DEFAULT_CURRENCY)
+    currency_changed = update_data.get('base_currency', previous_currency) != previous_currency
+    if currency_changed:
+        update_data['totals_epoch'] = str(uuid.uuid4())
+    if update_data:
+        await db.users.update_one({"id": user_id}, {"$set": update_data})
+    if currency_changed:
+        await db.budget_totals.update_many({"user_id": user_id}, {"$set": {"spent": 0, "seeded": False}})
+        async for totals in db.budget_totals.find({"user_id": user_id}, {"_id": 0}):
+            await seed_budget_totals(db, fx, settings.archive_dir, user_id, totals['year'], totals['month'], totals['category'])
+    
+    updated = await db.users.find_one({"id": user_id}, {"_id": 0})
+    if isinstance(updated['created_at'], str):
+        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
+    
+    return User(**updated)
+
+# ============= DUPLICATE HELPERS =============
+
+def normalize_description(description: str) -> str:
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', description.lower()).split())
+
+def with_dedup_fields(transaction_dict: dict) -> dict:
+    # Amounts are compared in integer cents so float noise cannot split a block
+    amount_cents = int(round(transaction_dict['amount'] * 100))
+    key = '|'.join([
+        transaction_dict['user_id'],
+        transaction_dict['date'],
+        str(amount_cents),
+        transaction_dict.get('currency') or DEFAULT_CURRENCY,
+        normalize_description(transaction_dict['description'])
+    ])
+    transaction_dict['amount_cents'] = amount_cents
+    transaction_dict['fingerprint'] = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return transaction_dict
+
+def description_similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+async def backfill_dedup_fields(db: AsyncIOMotorDatabase, batch_size: int = 1000):
+    # Transactions written before fingerprints existed get them in batches.
+    # No index serves the $exists query, so once a pass finds nothing left
+    # the migration is recorded and later starts skip the collection scan
+    if await db.migrations.find_one({"_id": "dedup_fields"}):
+        return
+    while True:
+        docs = await db.transactions.find(
+            {"fingerprint": {"$exists": False}},
+            {"_id": 0, "id": 1, "user_id": 1, "date": 1, "amount": 1, "currency": 1, "description": 1}
+        ).to_list(batch_size)
+        if not docs:
+            await db.migrations.update_one(
+                {"_id": "dedup_fields"},
+                {"$set": {"completed_at": datetime.now(timezone.utc).isoformat()}},
+                upsert=True
+            )
+            return
+        # Rows from before multi-currency are in their owner's base currency
+        users = await db.users.find(
+            {"id": {"$in": list({d['user_id'] for d in docs})}},
+            {"_id": 0, "id": 1, "base_currency": 1}
+        ).to_list(None)
+        base_currencies = {u['id']: u.get('base_currency', DEFAULT_CURRENCY) for u in users}
+        
+        updates = []
+        for d in docs:
+            d.setdefault('currency', base_currencies.get(d['user_id'], DEFAULT_CURRENCY))
+            fields = with_dedup_fields(dict(d))
+            updates.append(UpdateOne(
+                {"id": d['id']},
+                {"$set": {
+                    "currency": d['currency'],
+                    "amount_cents": fields['amount_cents'],
+                    "fingerprint": fields['fingerprint']
+                }}
+            ))
+        await db.transactions.bulk_write(updates, ordered=False)
+
+# ============= BUDGET ALERT HELPERS =============
+
+def budget_period(date_str: str) -> Optional[tuple]:
+    try:
+        parsed = date.fromisoformat(date_str)
+    except ValueError:
+        return None
+    return parsed.year, parsed.month
+
+async def evaluate_budget_alerts(db: AsyncIOMotorDatabase, user_id: str, year: int, month: int, category: str, before: float, after: float):
+    budget = await db.budgets.find_one(
+        {"user_id": user_id, "category": category, "month": month, "year": year},
+        {"_id": 0}
+    )
+    if not budget or budget['amount'] <= 0:
+        return
+    
+    for threshold in BUDGET_ALERT_THRESHOLDS:
+        limit = budget['amount'] * threshold / 100
+        if not before < limit <= after:
+            continue
+        alert = BudgetAlert(
+            user_id=user_id,
+            budget_id=budget['id'],
+            month=month,
+            year=year,
+            category=category,
+            threshold=threshold,
+            spent=after,
+            budget_amount=budget['amount']
+        )
+        alert_dict = alert.model_dump()
+        alert_dict['created_at'] = alert_dict['created_at'].isoformat()
+        try:
+            await db.alerts.insert_one(alert_dict)
+        except DuplicateKeyError:
+            # Already fired this period, e.g. spending dipped and re-crossed
+            # or a concurrent write got there first
+            pass
+
+async def record_spending(db: AsyncIOMotorDatabase, fx: FxRates, archive_dir: Path, user_id: str, date_str: str, category: str, delta: float):
+    # delta is in the user's base currency, like the budget amounts
+    period = budget_period(date_str)
+    if period is None or delta == 0:
+        return
+    year, month = period
+    
+    # $inc is atomic, so concurrent writers each see a distinct before/after
+    # pair and only one of them can observe a given threshold crossing
+    totals = await db.budget_totals.find_one_and_update(
+        {"user_id": user_id, "year": year, "month": month, "category": category},
+        {"$inc": {"spent": delta}, "$setOnInsert": {"seeded": False}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    spent = totals['spent']
+    if not totals.get('seeded') and await db.budgets.find_one(
+        {"user_id": user_id, "category": category, "month": month, "year": year}, {"_id": 1}
+    ):
+        # A budget from before running totals existed has an unseeded period;
+        # seed it so alerts see the whole month, not just the writes since
+        spent = await seed_budget_totals(db, fx, archive_dir, user_id, year, month, category)
+    if delta > 0:
+        await evaluate_budget_alerts(db, user_id, year, month, category, spent - delta, spent)
+
+async def seed_budget_totals(db: AsyncIOMotorDatabase, fx: FxRates, archive_dir: Path, user_id: str, year: int, month: int, category: str) -> float:
+    # Every transaction written in the current totals epoch reaches the running
+    # total through record_spending. Seeding adds the older ones, hot or
+    # archived, once per period. It only ever $incs, so increments landing
+    # while it aggregates are kept, and a row is never in both sums
+    key = {"user_id": user_id, "year": year, "month": month, "category": category}
+    totals = await db.budget_totals.find_one(key, {"_id": 0})
+    if totals and totals.get('seeded'):
+        return totals['spent']
+    
+    base_currency, epoch = await get_totals_basis(db, user_id)
+    start_date = f"{year}-{month:02d}-01"
+    end_date = f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01"
+    match = {
+        "user_id": user_id,
+        "type": "expense",
+        "category": category,
+        "date": {"$gte": start_date, "$lt": end_date},
+        "totals_epoch": {"$ne": epoch}
+    }
+    archived = None
+    cutoff = await get_archive_cutoff(db, user_id)
+    if cutoff and start_date < cutoff:
+        archived = await asyncio.to_thread(
+            scan_archive_uncounted, archive_dir, user_id, start_date, end_date, category, epoch
+        )
+    _, amounts, _ = await aggregate_in_base(db, fx, match, [], base_currency, archived)
+    
+    try:
+        totals = await db.budget_totals.find_one_and_update(
+            {**key, "seeded": {"$ne": True}},
+            {"$inc": {"spent": float(amounts.sum())}, "$set": {"seeded": True}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent budget write seeded the period first
+        totals = await db.budget_totals.find_one(key, {"_id": 0})
+    return totals['spent']
+
+async def seed_transaction_period(db: AsyncIOMotorDatabase, fx: FxRates, archive_dir: Path, transaction: dict, epoch: str):
+    # A row from an earlier epoch is only part of its period's total once that
+    # period is seeded, so edits and deletes seed it before taking the row out
+    period = budget_period(transaction['date'])
+    if transaction['type'] == 'expense' and period and transaction.get('totals_epoch') != epoch:
+        await seed_budget_totals(db, fx, archive_dir, transaction['user_id'], *period, transaction['category'])
+
 # ============= TRANSACTION ROUTES =============
 
+async def raise_missing_transaction(db: AsyncIOMotorDatabase, settings: Settings, user_id: str, transaction_id: str):
+    # Writes only reach hot rows; archived ones (or ones being archived) are read-only
+    hot = await db.transactions.find_one({"id": transaction_id, "user_id": user_id}, {"_id": 0, "id": 1})
+    if hot or (await get_archive_cutoff(db, user_id) and await asyncio.to_thread(
+        find_archived_transaction, settings.archive_dir, user_id, transaction_id
+    )):
+        raise HTTPException(status_code=409, detail="Archived transactions are read-only")
+    raise HTTPException(status_code=404, detail="Transaction not found")
+
 @api_router.post("/transactions", response_model=Transaction)
-async def create_transaction(transaction_data: TransactionCreate, user_id: str = Depends(get_current_user)):
-    transaction = Transaction(**transaction_data.model_dump(), user_id=user_id)
-    transaction_dict = transaction.model_dump()
+async def create_transaction(transaction_data: TransactionCreate, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), fx: FxRates = Depends(get_fx_rates), reject_duplicates: bool = False):
+    base_currency, epoch = await get_totals_basis(db, user_id)
+    transaction_fields = transaction_data.model_dump()
+    transaction_fields['currency'] = normalize_currency(fx, transaction_data.currency or base_currency)
+    
+    transaction = Transaction(**transaction_fields, user_id=user_id)
+    transaction_dict = with_dedup_fields(transaction.model_dump())
     transaction_dict['created_at'] = transaction_dict['created_at'].isoformat()
+    transaction_dict['totals_epoch'] = epoch
+    
+    # Best effort: the check and the insert are separate, so two identical
+    # requests racing each other can both be stored. They remain visible to
+    # GET /transactions/duplicates as an exact pair
+    if reject_duplicates:
+        duplicate = await db.transactions.find_one(
+            {"user_id": user_id, "fingerprint": transaction_dict['fingerprint']},
+            {"_id": 0, "id": 1}
+        )
+        if duplicate:
+            raise HTTPException(status_code=409, detail=f"Duplicate of transaction {duplicate['id']}")
     
     await db.transactions.insert_one(transaction_dict)
+    if transaction.type == 'expense':
+        spent = to_base_currency(fx, transaction.amount, transaction.currency, transaction.date, base_currency)
+        await record_spending(db, fx, settings.archive_dir, user_id, transaction.date, transaction.category, spent)
     return transaction
 
 @api_router.get("/transactions", response_model=List[Transaction])
-async def get_transactions(user_id: str = Depends(get_current_user), type: Optional[str] = None):
+async def get_transactions(user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), type: Optional[str] = None):
     query = {"user_id": user_id}
     if type:
         query["type"] = type
     
     transactions = await db.transactions.find(query, {"_id": 0}).sort("date", -1).to_list(1000)
     
+    # Older history continues from the archive once the hot rows run out
+    if len(transactions) < 1000 and await get_archive_cutoff(db, user_id):
+        archived = await asyncio.to_thread(
+            scan_archive, settings.archive_dir, user_id, None, None, None, 1000 - len(transactions), type
+        )
+        transactions.extend({**t, "archived": True} for t in archived.to_pylist())
+    
     for t in transactions:
         if isinstance(t['created_at'], str):
             t['created_at'] = datetime.fromisoformat(t['created_at'])
     
     return transactions
 
+@api_router.get("/transactions/duplicates")
+async def get_duplicate_transactions(user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), days: int = 3, similarity: float = 0.8):
+    if not 0 <= days <= 31:
+        raise HTTPException(status_code=400, detail="Days must be between 0 and 31")
+    
+    # Blocking: the (user, currency, amount_cents, date) index streams rows so
+    # that candidates with the same amount are adjacent, and only pairs
+    # inside one block and within the date window are ever compared
+    cursor = db.transactions.find(
+        {"user_id": user_id},
+        {"_id": 0, "id": 1, "date": 1, "amount": 1, "amount_cents": 1, "currency": 1,
+         "category": 1, "description": 1, "fingerprint": 1, "recurring_rule_id": 1}
+    ).sort([("currency", 1), ("amount_cents", 1), ("date", 1)])
+    
+    pairs = []
+    block, block_key = [], None
+    
+    def scan_block():
+        for i, (day_i, norm_i, print_i, t_i) in enumerate(block):
+            for day_j, norm_j, print_j, t_j in block[i + 1:]:
+                if day_j - day_i > days:
+                    break
+                # Occurrences of one recurring rule repeat by design
+                rule_id = t_i.get('recurring_rule_id')
+                if rule_id and rule_id == t_j.get('recurring_rule_id'):
+                    continue
+                exact = print_i == print_j
+                score = 1.0 if exact else description_similarity(norm_i, norm_j)
+                if score >= similarity:
+                    pairs.append({
+                        "amount": t_i['amount'],
+                        "currency": t_i.get('currency', DEFAULT_CURRENCY),
+                        "days_apart": day_j - day_i,
+                        "similarity": round(score, 3),
+                        "exact": exact,
+                        "transactions": [t_i, t_j]
+                    })
+    
+    async for t in cursor:
+        # Rows still waiting for the fingerprint backfill cannot be blocked yet
+        amount_cents = t.pop('amount_cents', None)
+        fingerprint = t.pop('fingerprint', None)
+        if amount_cents is None:
+            continue
+        key = (t.get('currency'), amount_cents)
+        if key != block_key:
+            scan_block()
+            block, block_key = [], key
+            if len(pairs) >= DUPLICATE_RESULT_LIMIT:
+                break
+        try:
+            day = date.fromisoformat(t['date']).toordinal()
+        except ValueError:
+            continue
+        block.append((day, normalize_description(t['description']), fingerprint, t))
+    else:
+        scan_block()
+    
+    return pairs[:DUPLICATE_RESULT_LIMIT]
+
 @api_router.get("/transactions/{transaction_id}", response_model=Transaction)
-async def get_transaction(transaction_id: str, user_id: str = Depends(get_current_user)):
+async def get_transaction(transaction_id: str, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings)):
     transaction = await db.transactions.find_one({"id": transaction_id, "user_id": user_id}, {"_id": 0})
+    if not transaction and await get_archive_cutoff(db, user_id):
+        transaction = await asyncio.to_thread(find_archived_transaction, settings.archive_dir, user_id, transaction_id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
@@ -198,13 +790,41 @@ async def get_transaction(transaction_id: str, user_id: str = Depends(get_curren
     return Transaction(**transaction)
 
 @api_router.put("/transactions/{transaction_id}", response_model=Transaction)
-async def update_transaction(transaction_id: str, transaction_data: TransactionCreate, user_id: str = Depends(get_current_user)):
+async def update_transaction(transaction_id: str, transaction_data: TransactionCreate, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), fx: FxRates = Depends(get_fx_rates)):
     existing = await db.transactions.find_one({"id": transaction_id, "user_id": user_id})
     if not existing:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+        await raise_missing_transaction(db, settings, user_id, transaction_id)
     
+    base_currency, epoch = await get_totals_basis(db, user_id)
     update_data = transaction_data.model_dump()
-    await db.transactions.update_one({"id": transaction_id}, {"$set": update_data})
+    update_data['currency'] = normalize_currency(fx, transaction_data.currency or existing.get('currency', base_currency))
+    update_data = with_dedup_fields({**update_data, "user_id": user_id})
+    update_data['totals_epoch'] = epoch
+    await seed_transaction_period(db, fx, settings.archive_dir, existing, epoch)
+    
+    # Rows claimed by a running archive pass are no longer writable, so an
+    # edit can never land after the archiver has copied the row. The row as
+    # it was just before this write is what leaves the running totals
+    existing = await db.transactions.find_one_and_update(
+        {"id": transaction_id, "user_id": user_id, "archive_run": {"$exists": False}},
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not existing:
+        await raise_missing_transaction(db, settings, user_id, transaction_id)
+    
+    # Move the spending between running totals; an unchanged period and
+    # category collapses into a single net delta
+    old_amount, new_amount = 0, 0
+    if existing['type'] == 'expense':
+        old_amount = to_base_currency(fx, existing['amount'], existing.get('currency', base_currency), existing['date'], base_currency)
+    if update_data['type'] == 'expense':
+        new_amount = to_base_currency(fx, update_data['amount'], update_data['currency'], update_data['date'], base_currency)
+    if budget_period(existing['date']) == budget_period(update_data['date']) and existing['category'] == update_data['category']:
+        await record_spending(db, fx, settings.archive_dir, user_id, update_data['date'], update_data['category'], new_amount - old_amount)
+    else:
+        await record_spending(db, fx, settings.archive_dir, user_id, existing['date'], existing['category'], -old_amount)
+        await record_spending(db, fx, settings.archive_dir, user_id, update_data['date'], update_data['category'], new_amount)
     
     updated = await db.transactions.find_one({"id": transaction_id}, {"_id": 0})
     if isinstance(updated['created_at'], str):
@@ -213,16 +833,70 @@ async def update_transaction(transaction_id: str, transaction_data: TransactionC
     return Transaction(**updated)
 
 @api_router.delete("/transactions/{transaction_id}")
-async def delete_transaction(transaction_id: str, user_id: str = Depends(get_current_user)):
-    result = await db.transactions.delete_one({"id": transaction_id, "user_id": user_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+async def delete_transaction(transaction_id: str, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), fx: FxRates = Depends(get_fx_rates)):
+    query = {"id": transaction_id, "user_id": user_id, "archive_run": {"$exists": False}}
+    existing = await db.transactions.find_one(query)
+    if not existing:
+        await raise_missing_transaction(db, settings, user_id, transaction_id)
+    base_currency, epoch = await get_totals_basis(db, user_id)
+    await seed_transaction_period(db, fx, settings.archive_dir, existing, epoch)
+    
+    deleted = await db.transactions.find_one_and_delete(query)
+    if not deleted:
+        await raise_missing_transaction(db, settings, user_id, transaction_id)
+    if deleted['type'] == 'expense':
+        spent = to_base_currency(fx, deleted['amount'], deleted.get('currency', base_currency), deleted['date'], base_currency)
+        await record_spending(db, fx, settings.archive_dir, user_id, deleted['date'], deleted['category'], -spent)
     return {"message": "Transaction deleted"}
 
+# ============= RECURRING ROUTES =============
+
+@api_router.post("/recurring", response_model=RecurringRule)
+async def create_recurring_rule(rule_data: RecurringRuleCreate, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), fx: FxRates = Depends(get_fx_rates)):
+    if rule_data.frequency not in RECURRING_FREQUENCIES:
+        raise HTTPException(status_code=400, detail=f"Frequency must be one of {', '.join(RECURRING_FREQUENCIES)}")
+    if rule_data.interval < 1:
+        raise HTTPException(status_code=400, detail="Interval must be at least 1")
+    try:
+        start = date.fromisoformat(rule_data.start_date)
+        if rule_data.end_date and date.fromisoformat(rule_data.end_date) < start:
+            raise HTTPException(status_code=400, detail="End date must not be before start date")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+    
+    rule_fields = rule_data.model_dump()
+    rule_fields['currency'] = normalize_currency(fx, rule_data.currency or await get_base_currency(db, user_id))
+    
+    # The scheduler picks the rule up from its first occurrence onwards
+    rule = RecurringRule(**rule_fields, user_id=user_id, next_run=rule_data.start_date)
+    rule_dict = rule.model_dump()
+    rule_dict['created_at'] = rule_dict['created_at'].isoformat()
+    
+    await db.recurring_rules.insert_one(rule_dict)
+    return rule
+
+@api_router.get("/recurring", response_model=List[RecurringRule])
+async def get_recurring_rules(user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
+    rules = await db.recurring_rules.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    
+    for r in rules:
+        if isinstance(r['created_at'], str):
+            r['created_at'] = datetime.fromisoformat(r['created_at'])
+    
+    return rules
+
+@api_router.delete("/recurring/{rule_id}")
+async def delete_recurring_rule(rule_id: str, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
+    # Already materialized transactions are kept, only future occurrences stop
+    result = await db.recurring_rules.delete_one({"id": rule_id, "user_id": user_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Recurring rule not found")
+    return {"message": "Recurring rule deleted"}
+
 # ============= BUDGET ROUTES =============
 
 @api_router.post("/budgets", response_model=Budget)
-async def create_budget(budget_data: BudgetCreate, user_id: str = Depends(get_current_user)):
+async def create_budget(budget_data: BudgetCreate, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), fx: FxRates = Depends(get_fx_rates)):
     # Check if budget already exists for this category/month/year
     existing = await db.budgets.find_one({
         "user_id": user_id,
@@ -240,6 +914,10 @@ async def create_budget(budget_data: BudgetCreate, user_id: str = Depends(get_cu
         updated = await db.budgets.find_one({"id": existing["id"]}, {"_id": 0})
         if isinstance(updated['created_at'], str):
             updated['created_at'] = datetime.fromisoformat(updated['created_at'])
+        
+        # A lowered budget can already be exceeded by the current spending
+        spent = await seed_budget_totals(db, fx, settings.archive_dir, user_id, budget_data.year, budget_data.month, budget_data.category)
+        await evaluate_budget_alerts(db, user_id, budget_data.year, budget_data.month, budget_data.category, 0, spent)
         return Budget(**updated)
     
     budget = Budget(**budget_data.model_dump(), user_id=user_id)
@@ -247,10 +925,12 @@ async def create_budget(budget_data: BudgetCreate, user_id: str = Depends(get_cu
     budget_dict['created_at'] = budget_dict['created_at'].isoformat()
     
     await db.budgets.insert_one(budget_dict)
+    spent = await seed_budget_totals(db, fx, settings.archive_dir, user_id, budget.year, budget.month, budget.category)
+    await evaluate_budget_alerts(db, user_id, budget.year, budget.month, budget.category, 0, spent)
     return budget
 
 @api_router.get("/budgets", response_model=List[Budget])
-async def get_budgets(user_id: str = Depends(get_current_user), month: Optional[int] = None, year: Optional[int] = None):
+async def get_budgets(user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), month: Optional[int] = None, year: Optional[int] = None):
     query = {"user_id": user_id}
     if month:
         query["month"] = month
@@ -266,16 +946,34 @@ async def get_budgets(user_id: str = Depends(get_current_user), month: Optional[
     return budgets
 
 @api_router.delete("/budgets/{budget_id}")
-async def delete_budget(budget_id: str, user_id: str = Depends(get_current_user)):
+async def delete_budget(budget_id: str, user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
     result = await db.budgets.delete_one({"id": budget_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Budget not found")
     return {"message": "Budget deleted"}
 
+# ============= ALERT ROUTES =============
+
+@api_router.get("/alerts", response_model=List[BudgetAlert])
+async def get_alerts(user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), month: Optional[int] = None, year: Optional[int] = None):
+    query = {"user_id": user_id}
+    if month:
+        query["month"] = month
+    if year:
+        query["year"] = year
+    
+    alerts = await db.alerts.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    
+    for a in alerts:
+        if isinstance(a['created_at'], str):
+            a['created_at'] = datetime.fromisoformat(a['created_at'])
+    
+    return alerts
+
 # ============= REPORT ROUTES =============
 
 @api_router.get("/reports/summary")
-async def get_summary(user_id: str = Depends(get_current_user), month: Optional[int] = None, year: Optional[int] = None):
+async def get_summary(user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), fx: FxRates = Depends(get_fx_rates), month: Optional[int] = None, year: Optional[int] = None):
     query = {"user_id": user_id}
     
     # Filter by month/year if provided
@@ -289,25 +987,40 @@ async def get_summary(user_id: str = Depends(get_current_user), month: Optional[
             end_date = f"{year}-{month + 1:02d}-01"
         query["date"] = {"$gte": start_date, "$lt": end_date}
     
-    # Get all transactions
-    transactions = await db.transactions.find(query, {"_id": 0}).to_list(10000)
+    # Periods before the archive cutoff are read from the Parquet files
+    archived = None
+    cutoff = await get_archive_cutoff(db, user_id)
+    if cutoff and (not (month and year) or start_date < cutoff):
+        archived = await asyncio.to_thread(
+            scan_archive, settings.archive_dir, user_id, start_date if month and year else None,
+            end_date if month and year else None, ["type", "category", "amount", "currency", "date"]
+        )
+    
+    # Totals per type/category/currency/date, converted to the base currency
+    base_currency = await get_base_currency(db, user_id)
+    groups, amounts, unconverted = await aggregate_in_base(db, fx, query, ["type", "category"], base_currency, archived)
+    types = np.array([g['type'] for g in groups], dtype=object)
+    categories = np.array([g['category'] for g in groups], dtype=object)
     
     # Calculate totals
-    total_income = sum(t['amount'] for t in transactions if t['type'] == 'income')
-    total_expense = sum(t['amount'] for t in transactions if t['type'] == 'expense')
+    expense_mask = types == 'expense'
+    total_income = float(amounts[types == 'income'].sum())
+    total_expense = float(amounts[expense_mask].sum())
     total_savings = total_income - total_expense
     
     # Category breakdown
     category_breakdown = {}
-    for t in transactions:
-        if t['type'] == 'expense':
-            category = t['category']
-            category_breakdown[category] = category_breakdown.get(category, 0) + t['amount']
+    if expense_mask.any():
+        names, inverse = np.unique(categories[expense_mask].astype(str), return_inverse=True)
+        sums = np.bincount(inverse, weights=amounts[expense_mask])
+        category_breakdown = {str(name): float(amt) for name, amt in zip(names, sums)}
     
     # Top 5 spending categories
     top_categories = sorted(category_breakdown.items(), key=lambda x: x[1], reverse=True)[:5]
     
     return {
+        "base_currency": base_currency,
+        "unconverted_currencies": unconverted,
         "total_income": total_income,
         "total_expense": total_expense,
         "total_savings": total_savings,
@@ -319,25 +1032,47 @@ async def get_summary(user_id: str = Depends(get_current_user), month: Optional[
     }
 
 @api_router.get("/reports/monthly")
-async def get_monthly_report(user_id: str = Depends(get_current_user)):
+async def get_monthly_report(user_id: str = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db), settings: Settings = Depends(get_settings), fx: FxRates = Depends(get_fx_rates)):
     # Get last 6 months of data
     from datetime import datetime, timedelta
-    transactions = await db.transactions.find({"user_id": user_id}, {"_id": 0}).to_list(10000)
+    base_currency = await get_base_currency(db, user_id)
+    groups, amounts, _ = await aggregate_in_base(db, fx, {"user_id": user_id}, ["type"], base_currency)
+    
+    # The rollups list the archived months, so only archived months that can
+    # still make the last six are read back from the Parquet files
+    if await get_archive_cutoff(db, user_id):
+        archived_months = {
+            f"{r['_id']['year']}-{r['_id']['month']:02d}"
+            for r in await db.archive_rollups.aggregate([
+                {"$match": {"user_id": user_id}},
+                {"$group": {"_id": {"year": "$year", "month": "$month"}}}
+            ]).to_list(None)
+        }
+        recent = sorted(archived_months | {g['date'][:7] for g in groups}, reverse=True)[:6]
+        recent_archived = [m for m in recent if m in archived_months]
+        if recent_archived:
+            archived = await asyncio.to_thread(
+                scan_archive, settings.archive_dir, user_id, f"{min(recent_archived)}-01", None,
+                ["type", "amount", "currency", "date"]
+            )
+            archived_groups, archived_amounts, _ = convert_groups(fx, *archive_groups(archived, ["type"]), base_currency)
+            groups += archived_groups
+            amounts = np.concatenate([amounts, archived_amounts])
     
     # Group by month
     monthly_data = {}
-    for t in transactions:
+    for g, amount in zip(groups, amounts.tolist()):
         # Parse date (YYYY-MM-DD format)
-        date_parts = t['date'].split('-')
+        date_parts = g['date'].split('-')
         if len(date_parts) >= 2:
             month_key = f"{date_parts[0]}-{date_parts[1]}"
             if month_key not in monthly_data:
                 monthly_data[month_key] = {"income": 0, "expense": 0}
             
-            if t['type'] == 'income':
-                monthly_data[month_key]['income'] += t['amount']
+            if g['type'] == 'income':
+                monthly_data[month_key]['income'] += amount
             else:
-                monthly_data[month_key]['expense'] += t['amount']
+                monthly_data[month_key]['expense'] += amount
     
     # Convert to list and sort
     result = []
@@ -354,11 +1089,11 @@ async def get_monthly_report(user_id: str = Depends(get_current_user)):
 # ============= UPLOAD ROUTE =============
 
 @api_router.post("/upload")
-async def upload_file(file: UploadFile = File(...), user_id: str = Depends(get_current_user)):
+async def upload_file(file: UploadFile = File(...), user_id: str = Depends(get_current_user), settings: Settings = Depends(get_settings)):
     # Generate unique filename
     file_ext = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
     unique_filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = UPLOAD_DIR / unique_filename
+    file_path = settings.upload_dir / unique_filename
     
     # Save file
     with open(file_path, 'wb') as buffer:
@@ -366,23 +1101,585 @@ async def upload_file(file: UploadFile = File(...), user_id: str = Depends(get_c
     
     return {"file_url": f"/uploads/{unique_filename}"}
 
-# Include router
-app.include_router(api_router)
+# ============= RECURRING SCHEDULER =============
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
+def next_occurrence(rule: dict, current: date) -> date:
+    interval = rule.get('interval', 1)
+    if rule['frequency'] == 'daily':
+        return current + timedelta(days=interval)
+    if rule['frequency'] == 'weekly':
+        return current + timedelta(weeks=interval)
+    
+    # Monthly rules stay anchored to the start day, clamped for short months
+    anchor_day = date.fromisoformat(rule['start_date']).day
+    month_index = current.month - 1 + interval
+    year = current.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+def recurring_transaction_doc(rule: dict, occurrence: date) -> dict:
+    transaction = Transaction(
+        user_id=rule['user_id'],
+        type=rule['type'],
+        amount=rule['amount'],
+        currency=rule.get('currency', DEFAULT_CURRENCY),
+        category=rule['category'],
+        description=rule['description'],
+        date=occurrence.isoformat(),
+        recurring_rule_id=rule['id']
+    )
+    transaction_dict = with_dedup_fields(transaction.model_dump())
+    transaction_dict['created_at'] = transaction_dict['created_at'].isoformat()
+    transaction_dict['recurrence_key'] = f"{rule['id']}:{transaction.date}"
+    return transaction_dict
+
+async def acquire_lease(db: AsyncIOMotorDatabase, name: str, ttl_seconds: int) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        lease = await db.scheduler_leases.find_one_and_update(
+            {"_id": name, "$or": [{"expires_at": {"$lte": now}}, {"owner": WORKER_ID}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another worker holds an unexpired lease, the upsert collided with it
+        return False
+    return lease is not None
+
+async def flush_recurring_batch(db: AsyncIOMotorDatabase, fx: FxRates, archive_dir: Path, docs: List[dict], rule_updates: List[UpdateOne]) -> int:
+    inserted = len(docs)
+    if docs:
+        users = await db.users.find(
+            {"id": {"$in": list({d['user_id'] for d in docs})}},
+            {"_id": 0, "id": 1, "base_currency": 1, "totals_epoch": 1}
+        ).to_list(None)
+        users = {u['id']: u for u in users}
+        for d in docs:
+            d['totals_epoch'] = users.get(d['user_id'], {}).get('totals_epoch', INITIAL_TOTALS_EPOCH)
+        try:
+            await db.transactions.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Occurrences written by an earlier or concurrent run trip the unique
+            # recurrence_key index; anything else is a real failure
+            if any(err['code'] != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+            inserted = e.details.get('nInserted', 0)
+            duplicates = {err['index'] for err in e.details.get('writeErrors', [])}
+            docs = [d for i, d in enumerate(docs) if i not in duplicates]
+        
+        # Feed newly stored expenses into the budget running totals, one
+        # increment per user, period and category in each user's base currency
+        spending = {}
+        for d in docs:
+            if d['type'] != 'expense':
+                continue
+            base_currency = users.get(d['user_id'], {}).get('base_currency', DEFAULT_CURRENCY)
+            amount = to_base_currency(fx, d['amount'], d['currency'], d['date'], base_currency)
+            key = (d['user_id'], d['date'][:7], d['category'])
+            spending[key] = spending.get(key, 0) + amount
+        for (user_id, month_key, category), amount in spending.items():
+            await record_spending(db, fx, archive_dir, user_id, f"{month_key}-01", category, amount)
+    
+    # Rules only advance once their occurrences are stored, so a crash in
+    # between just replays the batch against the idempotency key
+    if rule_updates:
+        await db.recurring_rules.bulk_write(rule_updates, ordered=False)
+    return inserted
+
+async def materialize_recurring(db: AsyncIOMotorDatabase, fx: FxRates, archive_dir: Path, batch_size: int, today: Optional[date] = None) -> int:
+    today = today or datetime.now(timezone.utc).date()
+    docs, rule_updates, inserted = [], [], 0
+    
+    # Rules that fell behind during downtime emit every missed occurrence in
+    # one pass, and all users share the same insert_many batches
+    cursor = db.recurring_rules.find(
+        {"active": True, "next_run": {"$lte": today.isoformat()}},
+        {"_id": 0}
+    ).batch_size(batch_size)
+    async for rule in cursor:
+        occurrence = date.fromisoformat(rule['next_run'])
+        end = date.fromisoformat(rule['end_date']) if rule.get('end_date') else None
+        while occurrence <= today and (end is None or occurrence <= end):
+            docs.append(recurring_transaction_doc(rule, occurrence))
+            occurrence = next_occurrence(rule, occurrence)
+            if len(docs) >= batch_size:
+                # A long backlog (e.g. a backdated daily rule) is flushed as it
+                # is generated; the rule resumes after the stored occurrences
+                rule_updates.append(UpdateOne({"id": rule['id']}, {"$set": {"next_run": occurrence.isoformat()}}))
+                inserted += await flush_recurring_batch(db, fx, archive_dir, docs, rule_updates)
+                docs, rule_updates = [], []
+        
+        update = {"next_run": occurrence.isoformat()}
+        if end is not None and occurrence > end:
+            update["active"] = False
+        rule_updates.append(UpdateOne({"id": rule['id']}, {"$set": update}))
+    
+    if docs or rule_updates:
+        inserted += await flush_recurring_batch(db, fx, archive_dir, docs, rule_updates)
+    return inserted
+
+async def run_recurring_scheduler(db: AsyncIOMotorDatabase, fx: FxRates, settings: Settings):
+    while True:
+        try:
+            # The lease is left to expire rather than released, so each
+            # interval window is materialized by a single worker
+            if await acquire_lease(db, "recurring", settings.recurring_interval_seconds):
+                inserted = await materialize_recurring(db, fx, settings.archive_dir, settings.recurring_batch_size)
+                if inserted:
+                    logger.info(f"Materialized {inserted} recurring transactions")
+        except Exception:
+            logger.exception("Recurring materializer failed")
+        await asyncio.sleep(settings.recurring_interval_seconds)
+
+# ============= ARCHIVER =============
+
+ARCHIVE_COLUMNS = (
+    'id', 'user_id', 'type', 'amount', 'currency', 'category', 'description',
+    'date', 'receipt_url', 'recurring_rule_id', 'totals_epoch', 'created_at'
 )
 
+def archive_schema():
+    import pyarrow as pa
+    return pa.schema([
+        (name, pa.float64() if name == 'amount' else pa.string())
+        for name in ARCHIVE_COLUMNS
+    ])
+
+def archive_path(archive_dir: Path, user_id: str, year: int) -> Path:
+    return archive_dir / user_id / f"{year}.parquet"
+
+def write_archive_year(archive_dir: Path, user_id: str, year: int, docs: List[dict]):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    
+    table = pa.Table.from_pylist(
+        [{name: d.get(name) for name in ARCHIVE_COLUMNS} for d in docs],
+        schema=archive_schema()
+    )
+    path = archive_path(archive_dir, user_id, year)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        # Merge into the year file; ids from an interrupted earlier run are
+        # replaced rather than duplicated
+        existing = pq.read_table(path, memory_map=True)
+        existing = existing.filter(pc.invert(pc.is_in(existing['id'], value_set=table['id'])))
+        table = pa.concat_tables([existing, table])
+    
+    # Sorted by date so row group statistics let date filters skip data
+    table = table.sort_by('date')
+    tmp_path = path.with_suffix('.parquet.tmp')
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+    
+    # Rollups are rebuilt from the whole year file, so re-runs stay idempotent
+    months = pc.utf8_slice_codeunits(table['date'], 5, 7)
+    grouped = table.append_column('month', months).group_by(['month', 'type', 'category', 'currency'])
+    return grouped.aggregate([('amount', 'sum'), ('amount', 'count')]).to_pylist()
+
+def scan_archive(archive_dir: Path, user_id: str, start_date: Optional[str], end_date: Optional[str],
+                 columns: Optional[List[str]] = None, limit: Optional[int] = None, type: Optional[str] = None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    filters = []
+    if start_date:
+        filters.append(('date', '>=', start_date))
+    if end_date:
+        filters.append(('date', '<', end_date))
+    if type:
+        filters.append(('type', '=', type))
+    
+    user_dir = archive_dir / user_id
+    paths = sorted(user_dir.glob('*.parquet'), reverse=True) if user_dir.exists() else []
+    tables, rows = [], 0
+    for path in paths:
+        year = int(path.stem)
+        if (start_date and year < int(start_date[:4])) or (end_date and f"{year}-01-01" >= end_date):
+            continue
+        # Memory-mapped reads let the OS page in only the needed column chunks
+        table = pq.read_table(path, columns=columns, filters=filters or None, memory_map=True)
+        if limit is not None:
+            table = table.sort_by([('date', 'descending')])
+        tables.append(table)
+        rows += table.num_rows
+        if limit is not None and rows >= limit:
+            break
+    
+    if not tables:
+        schema = archive_schema()
+        return schema.empty_table().select(columns) if columns else schema.empty_table()
+    result = pa.concat_tables(tables)
+    return result.slice(0, limit) if limit is not None else result
+
+def scan_archive_uncounted(archive_dir: Path, user_id: str, start_date: str, end_date: str, category: str, epoch: str):
+    # Archived expenses of one budget category not yet in the running totals
+    import pyarrow.compute as pc
+    
+    table = scan_archive(
+        archive_dir, user_id, start_date, end_date,
+        ["type", "category", "amount", "currency", "date", "totals_epoch"], type="expense"
+    )
+    counted = pc.fill_null(pc.equal(table['totals_epoch'], epoch), False)
+    return table.filter(pc.and_(pc.equal(table['category'], category), pc.invert(counted)))
+
+def find_archived_transaction(archive_dir: Path, user_id: str, transaction_id: str) -> Optional[dict]:
+    import pyarrow.parquet as pq
+    
+    user_dir = archive_dir / user_id
+    for path in (sorted(user_dir.glob('*.parquet'), reverse=True) if user_dir.exists() else []):
+        rows = pq.read_table(path, filters=[('id', '=', transaction_id)], memory_map=True).to_pylist()
+        if rows:
+            return {**rows[0], "archived": True}
+    return None
+
+async def get_archive_cutoff(db: AsyncIOMotorDatabase, user_id: str) -> Optional[str]:
+    state = await db.archive_state.find_one({"user_id": user_id}, {"_id": 0})
+    return state['cutoff'] if state else None
+
+async def archive_user(db: AsyncIOMotorDatabase, archive_dir: Path, user_id: str, cutoff: str) -> int:
+    base_currency = await get_base_currency(db, user_id)
+    oldest = await db.transactions.find_one(
+        {"user_id": user_id, "date": {"$lt": cutoff}},
+        {"_id": 0, "date": 1},
+        sort=[("date", 1)]
+    )
+    if not oldest:
+        return 0
+    
+    # Readers consult the archive from here on; until the hot rows below are
+    # deleted a report can briefly see an archived row twice
+    await db.archive_state.update_one(
+        {"user_id": user_id},
+        {"$max": {"cutoff": cutoff}},
+        upsert=True
+    )
+    
+    archived = 0
+    for year in range(int(oldest['date'][:4]), int(cutoff[:4]) + 1):
+        # Claim the rows first: edits and deletes skip claimed rows, so what is
+        # read below is exactly what gets deleted. Rows left claimed by a
+        # crashed run are claimed again by this one
+        run_id = str(uuid.uuid4())
+        await db.transactions.update_many(
+            {"user_id": user_id, "date": {"$gte": f"{year}-01-01", "$lt": min(f"{year + 1}-01-01", cutoff)}},
+            {"$set": {"archive_run": run_id}}
+        )
+        query = {"user_id": user_id, "archive_run": run_id}
+        docs = await db.transactions.find(query, {"_id": 0}).to_list(None)
+        if not docs:
+            continue
+        for d in docs:
+            d.setdefault('currency', base_currency)
+            if isinstance(d.get('created_at'), datetime):
+                d['created_at'] = d['created_at'].isoformat()
+        
+        rollups = await asyncio.to_thread(write_archive_year, archive_dir, user_id, year, docs)
+        await db.archive_rollups.delete_many({"user_id": user_id, "year": year})
+        await db.archive_rollups.insert_many([{
+            "user_id": user_id,
+            "year": year,
+            "month": int(r['month']),
+            "type": r['type'],
+            "category": r['category'],
+            "currency": r['currency'],
+            "amount": r['amount_sum'],
+            "count": r['amount_count']
+        } for r in rollups])
+        
+        # Only rows that made it into the file leave the hot collection
+        await db.transactions.delete_many(query)
+        archived += len(docs)
+    return archived
+
+async def archive_cold_history(db: AsyncIOMotorDatabase, settings: Settings, today: Optional[date] = None) -> int:
+    today = today or datetime.now(timezone.utc).date()
+    cutoff = (today - timedelta(days=settings.archive_after_days)).isoformat()
+    archived = 0
+    for user_id in await db.transactions.distinct("user_id", {"date": {"$lt": cutoff}}):
+        archived += await archive_user(db, settings.archive_dir, user_id, cutoff)
+    return archived
+
+async def run_archiver(db: AsyncIOMotorDatabase, settings: Settings):
+    while True:
+        try:
+            if await acquire_lease(db, "archive", settings.archive_interval_seconds):
+                archived = await archive_cold_history(db, settings)
+                if archived:
+                    logger.info(f"Archived {archived} transactions")
+        except Exception:
+            logger.exception("Archiver failed")
+        await asyncio.sleep(settings.archive_interval_seconds)
+
+# ============= RATE LIMITING =============
+
+class MemoryRateLimiter:
+    """Token buckets held in this worker's memory."""
+    
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        # key -> (tokens, monotonic time of last update, capacity, rate),
+        # least recently used first
+        self.buckets = OrderedDict()
+        self.max_keys = max_keys
+    
+    async def acquire(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        now = time.monotonic()
+        tokens, updated, _, _ = self.buckets.pop(key, (capacity, now, capacity, rate))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now, capacity, rate)
+        
+        if len(self.buckets) > self.max_keys:
+            self.prune(now)
+        return 0 if allowed else (cost - tokens) / rate
+    
+    def prune(self, now: float):
+        # Walks from the least recently used end: buckets refilled under their
+        # own capacity and rate carry no state and go, and the oldest go until
+        # 10% headroom is free, so pruning runs once per max_keys / 10 new keys
+        target = int(self.max_keys * 0.9)
+        while self.buckets:
+            tokens, updated, capacity, rate = next(iter(self.buckets.values()))
+            if len(self.buckets) <= target and tokens + (now - updated) * rate < capacity:
+                break
+            self.buckets.popitem(last=False)
+
+class MongoRateLimiter:
+    """Token buckets in the rate_limits collection, shared by all workers."""
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+    
+    async def acquire(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        # Refill and spend in one atomic pipeline update on the server clock,
+        # so workers with skewed clocks still agree on the bucket
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+        bucket = await self.db.rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [capacity, {"$add": [
+                        {"$ifNull": ["$tokens", capacity]},
+                        {"$multiply": [elapsed, rate]}
+                    ]}]},
+                    "updated_at": "$$NOW"
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0 if bucket['allowed'] else (cost - bucket['tokens']) / rate
+
+class RateLimitMiddleware:
+    """Sheds load past the concurrency cap, then charges the caller's bucket."""
+    
+    def __init__(self, app, settings: Settings):
+        self.app = app
+        self.settings = settings
+        self.in_flight = 0
+        self.memory_limiter = MemoryRateLimiter()
+        self.trusted_proxies = [ipaddress.ip_network(p, strict=False) for p in settings.trusted_proxies]
+    
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path', '')
+        if scope['type'] != 'http' or not path.startswith('/api/') or path == '/api/health':
+            await self.app(scope, receive, send)
+            return
+        
+        # Checked and incremented without an await in between, so the cap
+        # holds across concurrent requests on the event loop
+        if self.in_flight >= self.settings.max_concurrent_requests:
+            await self.reject(scope, receive, send, 503, "Server busy, retry later", 1)
+            return
+        
+        self.in_flight += 1
+        try:
+            retry_after = await self.charge(scope, path)
+            if retry_after:
+                await self.reject(scope, receive, send, 429, "Rate limit exceeded", retry_after)
+                return
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+    
+    async def charge(self, scope, path: str) -> float:
+        settings = self.settings
+        client_ip = self.client_ip(scope)
+        if path in AUTH_ROUTES:
+            key = f"ip:{client_ip}:auth"
+            capacity, rate = settings.auth_rate_limit_capacity, settings.auth_rate_limit_refill_per_second
+        else:
+            user_id = self.user_from_headers(scope)
+            key = f"user:{user_id}" if user_id else f"ip:{client_ip}"
+            capacity, rate = settings.rate_limit_capacity, settings.rate_limit_refill_per_second
+        cost = ROUTE_COSTS.get(path, 1)
+        
+        if settings.rate_limit_backend == 'mongo':
+            try:
+                return await MongoRateLimiter(scope['app'].state.db).acquire(key, cost, capacity, rate)
+            except Exception:
+                # Fail open to the local buckets rather than reject traffic
+                logger.exception("Shared rate limiter unavailable")
+        return await self.memory_limiter.acquire(key, cost, capacity, rate)
+    
+    def is_trusted(self, ip: str) -> bool:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+    
+    def client_ip(self, scope) -> str:
+        peer = scope['client'][0] if scope.get('client') else 'unknown'
+        if not self.is_trusted(peer):
+            return peer
+        # Each trusted proxy appends the address it received from; walk back
+        # from the nearest hop and stop at the first one we don't trust
+        hops = []
+        for name, value in scope.get('headers', []):
+            if name == b'x-forwarded-for':
+                hops.extend(h.strip() for h in value.decode('latin-1').split(','))
+        for hop in reversed(hops):
+            if hop and not self.is_trusted(hop):
+                return hop
+        return peer
+    
+    def user_from_headers(self, scope) -> Optional[str]:
+        for name, value in scope.get('headers', []):
+            if name == b'authorization' and value[:7].lower() == b'bearer ':
+                try:
+                    return decode_token(value[7:].decode('latin-1'), self.settings.jwt_secret)
+                except HTTPException:
+                    return None
+        return None
+    
+    async def reject(self, scope, receive, send, status_code: int, detail: str, retry_after: float):
+        response = JSONResponse(
+            {"detail": detail},
+            status_code=status_code,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        await response(scope, receive, send)
+
+# ============= APP FACTORY =============
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    # One createIndexes round trip per collection, all issued concurrently
+    await asyncio.gather(
+        db.transactions.create_indexes([
+            # One transaction per (rule, occurrence date); manual entries have no key
+            IndexModel(
+                "recurrence_key",
+                unique=True,
+                partialFilterExpression={"recurrence_key": {"$exists": True}}
+            ),
+            # Archiver: finding users with cold history
+            IndexModel([("date", 1), ("user_id", 1)]),
+            # Duplicate detection: exact fingerprint lookups and the near-duplicate blocking scan
+            IndexModel([("user_id", 1), ("fingerprint", 1)]),
+            IndexModel([("user_id", 1), ("currency", 1), ("amount_cents", 1), ("date", 1)]),
+            # Archiver: rows claimed by an archive pass
+            IndexModel(
+                [("user_id", 1), ("archive_run", 1)],
+                partialFilterExpression={"archive_run": {"$exists": True}}
+            )
+        ]),
+        db.recurring_rules.create_indexes([
+            IndexModel([("active", 1), ("next_run", 1)]),
+            IndexModel("user_id")
+        ]),
+        db.users.create_indexes([IndexModel("id")]),
+        db.archive_state.create_indexes([IndexModel("user_id", unique=True)]),
+        db.archive_rollups.create_indexes([IndexModel([("user_id", 1), ("year", 1), ("month", 1)])]),
+        # Budget alerts: write-path lookups and once-per-period threshold crossings
+        db.budgets.create_indexes([IndexModel([("user_id", 1), ("category", 1), ("year", 1), ("month", 1)])]),
+        db.budget_totals.create_indexes([
+            IndexModel([("user_id", 1), ("year", 1), ("month", 1), ("category", 1)], unique=True)
+        ]),
+        db.alerts.create_indexes([
+            IndexModel([("budget_id", 1), ("threshold", 1)], unique=True),
+            IndexModel([("user_id", 1), ("created_at", -1)])
+        ]),
+        # Shared rate limit buckets expire once idle
+        db.rate_limits.create_indexes([IndexModel("updated_at", expireAfterSeconds=3600)])
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = app.state.settings
+    client = AsyncIOMotorClient(
+        settings.mongo_url,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+        connectTimeoutMS=settings.mongo_connect_timeout_ms
+    )
+    db = client[settings.db_name]
+    app.state.client = client
+    app.state.db = db
+    settings.upload_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Warm start: concurrent pings check out min_pool_size connections at
+    # once, so the first requests find an open pool instead of dialing
+    await asyncio.gather(*(db.command('ping') for _ in range(max(settings.mongo_min_pool_size, 1))))
+    fx = FxRates.load(settings.fx_rates_path)
+    app.state.fx_rates = fx
+    await ensure_indexes(db)
+    
+    tasks = []
+    if settings.background_tasks:
+        tasks = [
+            asyncio.create_task(run_recurring_scheduler(db, fx, settings)),
+            asyncio.create_task(run_archiver(db, settings)),
+            asyncio.create_task(backfill_dedup_fields(db))
+        ]
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    client.close()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    settings = settings or Settings.from_env()
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    
+    # Include router
+    app.include_router(api_router)
+    
+    # Added before CORS so that 429/503 responses still carry CORS headers
+    if settings.rate_limit_enabled:
+        app.add_middleware(RateLimitMiddleware, settings=settings)
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=settings.cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
+
+_app: Optional[FastAPI] = None
+
+def __getattr__(name: str):
+    # `uvicorn server:app` builds the default app on first access, so a plain
+    # import neither reads .env nor needs MONGO_URL
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Startup benchmark: import cost of server.py and time-to-first-request.
+
+Needs MONGO_URL/DB_NAME (or backend/.env) pointing at a reachable MongoDB,
+since the first request only succeeds after the lifespan warm-up.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).parent
+RUNS = int(os.environ.get('BENCH_RUNS', '5'))
+PORT = int(os.environ.get('BENCH_PORT', '8765'))
+
+def measure_import() -> float:
+    code = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def measure_first_request(timeout: float = 30.0) -> float:
+    env = {**os.environ, "BACKGROUND_TASKS": "false"}
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = requests.get(f"http://127.0.0.1:{PORT}/api/health", timeout=1)
+                if response.status_code == 200:
+                    return time.perf_counter() - start
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"No successful response within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def report(name: str, samples: list):
+    print(f"{name:<24} median {statistics.median(samples) * 1000:8.1f} ms   "
+          f"min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms")
+
+def main():
+    print(f"🚀 Startup benchmark ({RUNS} runs)")
+    report("import server", [measure_import() for _ in range(RUNS)])
+    report("time to first request", [measure_first_request() for _ in range(RUNS)])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -68,6 +68,16 @@ class FinanceTrackerAPITester:
             self.log_test(name, False, f"Request failed: {str(e)}")
             return False, {}
 
+    def test_health(self):
+        """Test health check"""
+        success, response = self.run_test(
+            "Health Check",
+            "GET",
+            "health",
+            200
+        )
+        return success
+
     def test_user_registration(self):
         """Test user registration"""
         test_email = f"test_{uuid.uuid4().hex[:8]}@example.com"
@@ -172,6 +182,62 @@ class FinanceTrackerAPITester:
             return True
         return False
 
+    def test_create_unsupported_currency_transaction(self):
+        """Test rejecting a transaction in a currency without FX rates"""
+        transaction_data = {
+            "type": "expense",
+            "amount": 10.00,
+            "currency": "XXX",
+            "category": "Food",
+            "description": "Unknown currency",
+            "date": datetime.now().strftime("%Y-%m-%d")
+        }
+        
+        success, response = self.run_test(
+            "Create Unsupported Currency Transaction",
+            "POST",
+            "transactions",
+            400,
+            data=transaction_data
+        )
+        return success
+
+    def test_reject_duplicate_transaction(self):
+        """Test rejecting an exact duplicate when reject_duplicates is set"""
+        transaction_data = {
+            "type": "expense",
+            "amount": 42.00,
+            "category": "Food",
+            "description": "Duplicate check",
+            "date": datetime.now().strftime("%Y-%m-%d")
+        }
+        self.run_test("Create Original Transaction", "POST", "transactions", 200, data=transaction_data)
+        
+        success, response = self.run_test(
+            "Reject Duplicate Transaction",
+            "POST",
+            "transactions?reject_duplicates=true",
+            409,
+            data=transaction_data
+        )
+        return success
+
+    def test_get_duplicate_transactions(self):
+        """Test listing near-duplicate transactions"""
+        success, response = self.run_test(
+            "Get Duplicate Transactions",
+            "GET",
+            "transactions/duplicates?days=3",
+            200
+        )
+        
+        if success and isinstance(response, list):
+            self.log_test("Duplicate List Format", True)
+            return True
+        else:
+            self.log_test("Duplicate List Format", False, "Response is not a list")
+            return False
+
     def test_get_transactions(self):
         """Test getting all transactions"""
         success, response = self.run_test(
@@ -293,6 +359,40 @@ class FinanceTrackerAPITester:
         )
         return success
 
+    def test_budget_alerts(self):
+        """Test that overspending a budget records a threshold alert"""
+        current_date = datetime.now()
+        budget_data = {
+            "month": current_date.month,
+            "year": current_date.year,
+            "category": "Alerts",
+            "amount": 100.00
+        }
+        self.run_test("Create Alert Budget", "POST", "budgets", 200, data=budget_data)
+        
+        transaction_data = {
+            "type": "expense",
+            "amount": 85.00,
+            "category": "Alerts",
+            "description": "Over 80 percent",
+            "date": current_date.strftime("%Y-%m-%d")
+        }
+        self.run_test("Create Alerting Expense", "POST", "transactions", 200, data=transaction_data)
+        
+        success, response = self.run_test(
+            "Get Budget Alerts",
+            "GET",
+            f"alerts?month={current_date.month}&year={current_date.year}",
+            200
+        )
+        
+        if success and any(a['category'] == 'Alerts' and a['threshold'] == 80 for a in response):
+            self.log_test("Budget Alert Fired", True)
+            return True
+        else:
+            self.log_test("Budget Alert Fired", False, "No 80% alert recorded")
+            return False
+
     def test_get_summary_report(self):
         """Test getting summary report"""
         success, response = self.run_test(
@@ -304,7 +404,7 @@ class FinanceTrackerAPITester:
         
         if success:
             # Check if response has expected fields
-            expected_fields = ['total_income', 'total_expense', 'total_savings', 'category_breakdown']
+            expected_fields = ['base_currency', 'total_income', 'total_expense', 'total_savings', 'category_breakdown']
             missing_fields = [field for field in expected_fields if field not in response]
             
             if missing_fields:
@@ -345,6 +445,74 @@ class FinanceTrackerAPITester:
         )
         return success
 
+    def test_create_recurring_rule(self):
+        """Test creating a recurring rule"""
+        rule_data = {
+            "type": "expense",
+            "amount": 1200.00,
+            "category": "Rent",
+            "description": "Monthly rent",
+            "frequency": "monthly",
+            "start_date": datetime.now().strftime("%Y-%m-%d")
+        }
+        
+        success, response = self.run_test(
+            "Create Recurring Rule",
+            "POST",
+            "recurring",
+            200,
+            data=rule_data
+        )
+        
+        if success and 'id' in response:
+            self.recurring_rule_id = response['id']
+            return True
+        return False
+
+    def test_create_invalid_recurring_rule(self):
+        """Test rejecting a recurring rule with an unknown frequency"""
+        rule_data = {
+            "type": "expense",
+            "amount": 10.00,
+            "category": "Misc",
+            "description": "Invalid rule",
+            "frequency": "hourly",
+            "start_date": datetime.now().strftime("%Y-%m-%d")
+        }
+        
+        success, response = self.run_test(
+            "Create Invalid Recurring Rule",
+            "POST",
+            "recurring",
+            400,
+            data=rule_data
+        )
+        return success
+
+    def test_get_recurring_rules(self):
+        """Test getting recurring rules"""
+        success, response = self.run_test(
+            "Get Recurring Rules",
+            "GET",
+            "recurring",
+            200
+        )
+        return success
+
+    def test_delete_recurring_rule(self):
+        """Test deleting a recurring rule"""
+        if not hasattr(self, 'recurring_rule_id'):
+            self.log_test("Delete Recurring Rule", False, "No recurring rule ID available")
+            return False
+            
+        success, response = self.run_test(
+            "Delete Recurring Rule",
+            "DELETE",
+            f"recurring/{self.recurring_rule_id}",
+            200
+        )
+        return success
+
     def test_invalid_auth(self):
         """Test API with invalid authentication"""
         # Save current token
@@ -368,6 +536,8 @@ class FinanceTrackerAPITester:
         print(f"📍 Testing against: {self.base_url}")
         print("=" * 60)
         
+        self.test_health()
+        
         # Authentication Tests
         print("\n🔐 Authentication Tests")
         if not self.test_user_registration():
@@ -382,6 +552,9 @@ class FinanceTrackerAPITester:
         print("\n💰 Transaction Tests")
         self.test_create_income_transaction()
         self.test_create_expense_transaction()
+        self.test_create_unsupported_currency_transaction()
+        self.test_reject_duplicate_transaction()
+        self.test_get_duplicate_transactions()
         self.test_get_transactions()
         self.test_get_transactions_by_type()
         self.test_get_single_transaction()
@@ -391,6 +564,13 @@ class FinanceTrackerAPITester:
         print("\n📊 Budget Tests")
         self.test_create_budget()
         self.test_get_budgets()
+        self.test_budget_alerts()
+        
+        # Recurring Tests
+        print("\n🔁 Recurring Tests")
+        self.test_create_recurring_rule()
+        self.test_create_invalid_recurring_rule()
+        self.test_get_recurring_rules()
         
         # Report Tests
         print("\n📈 Report Tests")
@@ -400,6 +580,7 @@ class FinanceTrackerAPITester:
         # Cleanup Tests
         print("\n🗑️ Cleanup Tests")
         self.test_delete_budget()
+        self.test_delete_recurring_rule()
         self.test_delete_transaction()
         
         # Print Results
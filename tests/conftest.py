@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+
+# EUR has two dated rates so as-of lookups and dates before the first rate are covered
+FX_RATES_CSV = """date,currency,rate
+2024-01-01,EUR,0.9
+2024-06-01,EUR,0.8
+2024-01-01,GBP,0.75
+"""
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()['finance_tracker_test']
+
+
+@pytest.fixture
+def fx_path(tmp_path):
+    path = tmp_path / 'fx_rates.csv'
+    path.write_text(FX_RATES_CSV)
+    return path
+
+
+@pytest.fixture
+def fx(fx_path):
+    return server.FxRates.load(fx_path)
+
+
+@pytest.fixture
+def settings(tmp_path, fx_path):
+    return server.Settings(
+        mongo_url='mongodb://localhost:27017',
+        db_name='finance_tracker_test',
+        upload_dir=tmp_path / 'uploads',
+        archive_dir=tmp_path / 'archive',
+        fx_rates_path=fx_path,
+        background_tasks=False,
+        rate_limit_enabled=False
+    )
+
+
+def make_client(settings, db, fx) -> TestClient:
+    # State the lifespan would set up, without a running MongoDB
+    app = server.create_app(settings)
+    app.state.db = db
+    app.state.fx_rates = fx
+    return TestClient(app)
+
+
+@pytest.fixture
+def client(settings, db, fx):
+    return make_client(settings, db, fx)
+
+
+def register(client: TestClient, email: str = 'user@example.com', base_currency: str = 'USD') -> tuple:
+    response = client.post('/api/auth/register', json={
+        'email': email,
+        'name': 'Test User',
+        'password': 'secret',
+        'base_currency': base_currency
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return body['user']['id'], {'Authorization': f"Bearer {body['token']}"}
@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from tests.conftest import register
+
+
+def test_fx_rates_are_per_app(monkeypatch, settings, tmp_path):
+    # The lifespan runs against an in-memory client instead of a MongoDB server
+    monkeypatch.setattr(server, 'AsyncIOMotorClient', lambda *args, **kwargs: AsyncMongoMockClient())
+
+    app_a = server.create_app(settings)
+    app_b = server.create_app(settings.model_copy(update={'fx_rates_path': tmp_path / 'missing.csv'}))
+    with TestClient(app_a) as client_a, TestClient(app_b) as client_b:
+        # Starting app B on an empty FX table leaves app A's table intact
+        register(client_a, base_currency='EUR')
+        response = client_b.post('/api/auth/register', json={
+            'email': 'other@example.com',
+            'name': 'Other',
+            'password': 'secret',
+            'base_currency': 'EUR'
+        })
+        assert response.status_code == 400
+        assert app_a.state.fx_rates is not app_b.state.fx_rates
+
+
+def test_health(client):
+    response = client.get('/api/health')
+    assert response.status_code == 200
+    assert response.json() == {'status': 'ok'}
@@ -0,0 +1,138 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import server
+from tests.conftest import register
+
+
+def archive_doc(id, day, amount=10.0, type='expense', category='Food', currency='USD'):
+    return {
+        'id': id,
+        'user_id': 'u1',
+        'type': type,
+        'amount': amount,
+        'currency': currency,
+        'category': category,
+        'description': f'row {id}',
+        'date': day,
+        'created_at': '2022-01-01T00:00:00+00:00'
+    }
+
+
+def test_write_archive_year_merges_and_replaces(tmp_path):
+    server.write_archive_year(tmp_path, 'u1', 2022, [archive_doc('a', '2022-03-01'), archive_doc('b', '2022-01-15')])
+    # A re-run with an already archived id replaces that row instead of duplicating it
+    rollups = server.write_archive_year(tmp_path, 'u1', 2022, [
+        archive_doc('a', '2022-03-01', amount=25.0),
+        archive_doc('c', '2022-03-20', type='income', category='Salary')
+    ])
+
+    table = server.scan_archive(tmp_path, 'u1', None, None)
+    assert table['id'].to_pylist() == ['b', 'a', 'c']  # sorted by date
+    assert table['amount'].to_pylist() == [10.0, 25.0, 10.0]
+
+    rollups = {(r['month'], r['type'], r['category']): (r['amount_sum'], r['amount_count']) for r in rollups}
+    assert rollups == {
+        ('01', 'expense', 'Food'): (10.0, 1),
+        ('03', 'expense', 'Food'): (25.0, 1),
+        ('03', 'income', 'Salary'): (10.0, 1)
+    }
+
+
+def test_scan_archive_filters(tmp_path):
+    server.write_archive_year(tmp_path, 'u1', 2021, [archive_doc('a', '2021-06-01'), archive_doc('b', '2021-12-31')])
+    server.write_archive_year(tmp_path, 'u1', 2022, [
+        archive_doc('c', '2022-01-01', type='income'),
+        archive_doc('d', '2022-02-01')
+    ])
+
+    ranged = server.scan_archive(tmp_path, 'u1', '2021-12-01', '2022-02-01', ['id', 'amount'])
+    assert sorted(ranged['id'].to_pylist()) == ['b', 'c']
+    assert ranged.column_names == ['id', 'amount']
+
+    # Limits read the newest rows first
+    newest = server.scan_archive(tmp_path, 'u1', None, None, limit=3, type='expense')
+    assert newest['id'].to_pylist() == ['d', 'b', 'a']
+
+    empty = server.scan_archive(tmp_path, 'u2', None, None, ['id'])
+    assert empty.num_rows == 0 and empty.column_names == ['id']
+
+    assert server.find_archived_transaction(tmp_path, 'u1', 'b')['archived'] is True
+    assert server.find_archived_transaction(tmp_path, 'u1', 'missing') is None
+
+
+def post_transaction(client, headers, day, amount=10, type='expense'):
+    response = client.post('/api/transactions', headers=headers, json={
+        'type': type, 'amount': amount, 'category': 'Food', 'description': f'on {day}', 'date': day
+    })
+    assert response.status_code == 200, response.text
+    return response.json()['id']
+
+
+def test_archived_rows_are_read_only(client, db, settings):
+    user_id, headers = register(client)
+    old_id = post_transaction(client, headers, '2021-05-01')
+    new_id = post_transaction(client, headers, '2024-05-01')
+
+    archived = asyncio.run(server.archive_cold_history(db, settings, today=date(2024, 6, 1)))
+    assert archived == 1
+
+    listed = {t['id']: t['archived'] for t in client.get('/api/transactions', headers=headers).json()}
+    assert listed == {old_id: True, new_id: False}
+
+    response = client.get(f'/api/transactions/{old_id}', headers=headers)
+    assert response.status_code == 200
+    assert response.json()['archived'] is True
+
+    update = {'type': 'expense', 'amount': 99, 'category': 'Food', 'description': 'edit', 'date': '2021-05-01'}
+    assert client.put(f'/api/transactions/{old_id}', headers=headers, json=update).status_code == 409
+    assert client.delete(f'/api/transactions/{old_id}', headers=headers).status_code == 409
+    assert client.delete('/api/transactions/missing', headers=headers).status_code == 404
+
+
+def test_rows_claimed_by_archive_pass_reject_writes(client, db):
+    user_id, headers = register(client)
+    transaction_id = post_transaction(client, headers, '2021-05-01')
+    # The state between the archiver claiming rows and deleting them
+    asyncio.run(db.transactions.update_one({'id': transaction_id}, {'$set': {'archive_run': 'run'}}))
+
+    update = {'type': 'expense', 'amount': 99, 'category': 'Food', 'description': 'edit', 'date': '2021-05-01'}
+    assert client.put(f'/api/transactions/{transaction_id}', headers=headers, json=update).status_code == 409
+    assert client.delete(f'/api/transactions/{transaction_id}', headers=headers).status_code == 409
+    stored = asyncio.run(db.transactions.find_one({'id': transaction_id}))
+    assert stored['amount'] == 10
+
+
+def test_monthly_report_scans_only_recent_archive(client, db, settings, monkeypatch):
+    user_id, headers = register(client)
+    for day in ['2020-03-01', '2021-11-01', '2022-02-01', '2022-03-01']:
+        post_transaction(client, headers, day)
+    for day in ['2024-01-01', '2024-02-01', '2024-03-01']:
+        post_transaction(client, headers, day, amount=5)
+    asyncio.run(server.archive_cold_history(db, settings, today=date(2024, 1, 1)))
+
+    scans = []
+    scan_archive = server.scan_archive
+    monkeypatch.setattr(server, 'scan_archive', lambda *args: scans.append(args[2]) or scan_archive(*args))
+
+    response = client.get('/api/reports/monthly', headers=headers)
+    assert response.status_code == 200
+    assert [m['month'] for m in response.json()] == ['2021-11', '2022-02', '2022-03', '2024-01', '2024-02', '2024-03']
+    assert [m['expense'] for m in response.json()] == [10, 10, 10, 5, 5, 5]
+    # 2020 is never read back
+    assert scans == ['2021-11-01']
+
+
+@pytest.mark.parametrize('month, year, expected', [(None, None, 25.0), (3, 2022, 10.0), (3, 2024, 5.0)])
+def test_summary_includes_archive(client, db, settings, month, year, expected):
+    user_id, headers = register(client)
+    post_transaction(client, headers, '2021-03-01')
+    post_transaction(client, headers, '2022-03-01')
+    post_transaction(client, headers, '2024-03-01', amount=5)
+    asyncio.run(server.archive_cold_history(db, settings, today=date(2024, 1, 1)))
+
+    params = {'month': month, 'year': year} if month else {}
+    response = client.get('/api/reports/summary', headers=headers, params=params)
+    assert response.json()['total_expense'] == expected
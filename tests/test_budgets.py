@@ -0,0 +1,139 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import server
+from tests.conftest import register
+
+
+@pytest.fixture(autouse=True)
+def indexes(db):
+    # Seeding and alerts rely on these unique indexes. Not ensure_indexes():
+    # mongomock ignores partialFilterExpression on the recurrence_key index
+    async def create():
+        await db.budget_totals.create_index([('user_id', 1), ('year', 1), ('month', 1), ('category', 1)], unique=True)
+        await db.alerts.create_index([('budget_id', 1), ('threshold', 1)], unique=True)
+    asyncio.run(create())
+
+
+def legacy_expense(db, user_id, id, day, amount, category='Food'):
+    # A row written before running totals existed carries no totals epoch
+    asyncio.run(db.transactions.insert_one({
+        'id': id, 'user_id': user_id, 'type': 'expense', 'amount': amount, 'currency': 'USD',
+        'category': category, 'description': f'legacy {id}', 'date': day,
+        'created_at': '2020-01-01T00:00:00+00:00'
+    }))
+
+
+def post_expense(client, headers, day, amount, currency=None):
+    response = client.post('/api/transactions', headers=headers, json={
+        'type': 'expense', 'amount': amount, 'currency': currency, 'category': 'Food',
+        'description': 'Groceries', 'date': day
+    })
+    assert response.status_code == 200, response.text
+    return response.json()['id']
+
+
+def spent(db, user_id, year, month, category='Food'):
+    totals = asyncio.run(db.budget_totals.find_one(
+        {'user_id': user_id, 'year': year, 'month': month, 'category': category}
+    ))
+    return totals['spent']
+
+
+def create_budget(client, headers, year, month, amount):
+    response = client.post('/api/budgets', headers=headers, json={
+        'year': year, 'month': month, 'category': 'Food', 'amount': amount
+    })
+    assert response.status_code == 200, response.text
+
+
+def test_seed_keeps_increments_landing_during_aggregate(client, db, fx, settings, monkeypatch):
+    user_id, headers = register(client)
+    legacy_expense(db, user_id, 'old', '2024-03-05', 30)
+
+    aggregate_in_base = server.aggregate_in_base
+    raced = []
+
+    async def racing_aggregate(*args, **kwargs):
+        result = await aggregate_in_base(*args, **kwargs)
+        if raced:
+            return result
+        raced.append(True)
+        # An expense stored and counted after the aggregate read the rows; it
+        # finds the budget and seeds concurrently, only one seed may apply
+        await db.transactions.insert_one({
+            'id': 'new', 'user_id': user_id, 'type': 'expense', 'amount': 50.0, 'currency': 'USD',
+            'category': 'Food', 'description': 'new', 'date': '2024-03-06',
+            'totals_epoch': server.INITIAL_TOTALS_EPOCH
+        })
+        await server.record_spending(db, fx, settings.archive_dir, user_id, '2024-03-06', 'Food', 50)
+        return result
+
+    monkeypatch.setattr(server, 'aggregate_in_base', racing_aggregate)
+    create_budget(client, headers, 2024, 3, 100)
+    monkeypatch.undo()
+
+    assert spent(db, user_id, 2024, 3) == 80
+    alerts = client.get('/api/alerts', headers=headers).json()
+    assert [a['threshold'] for a in alerts] == [80]
+
+    # Seeding is once per period; later writes only increment
+    post_expense(client, headers, '2024-03-07', 20)
+    create_budget(client, headers, 2024, 3, 100)
+    assert spent(db, user_id, 2024, 3) == 100
+    assert sorted(a['threshold'] for a in client.get('/api/alerts', headers=headers).json()) == [80, 100]
+
+
+def test_budget_from_before_running_totals_is_seeded_on_first_write(client, db):
+    user_id, headers = register(client)
+    # A budget and an expense stored before running totals existed
+    asyncio.run(db.budgets.insert_one({
+        'id': 'legacy-budget', 'user_id': user_id, 'year': 2024, 'month': 3, 'category': 'Food',
+        'amount': 100, 'created_at': '2020-01-01T00:00:00+00:00'
+    }))
+    legacy_expense(db, user_id, 'old', '2024-03-05', 70)
+
+    post_expense(client, headers, '2024-03-06', 40)
+    assert spent(db, user_id, 2024, 3) == 110
+    alerts = client.get('/api/alerts', headers=headers).json()
+    assert sorted(a['threshold'] for a in alerts) == [80, 100]
+
+
+def test_seed_includes_archived_rows(client, db, settings):
+    user_id, headers = register(client)
+    legacy_expense(db, user_id, 'old', '2021-03-05', 30)
+    post_expense(client, headers, '2021-03-06', 20)  # already counted when written
+    assert asyncio.run(server.archive_cold_history(db, settings, today=date(2024, 1, 1))) == 2
+
+    create_budget(client, headers, 2021, 3, 100)
+    assert spent(db, user_id, 2021, 3) == 50
+
+
+def test_edits_of_legacy_rows_before_seeding(client, db):
+    user_id, headers = register(client)
+    legacy_expense(db, user_id, 'a', '2024-03-05', 40)
+    legacy_expense(db, user_id, 'b', '2024-03-06', 10)
+
+    response = client.put('/api/transactions/a', headers=headers, json={
+        'type': 'expense', 'amount': 25, 'category': 'Food', 'description': 'edited', 'date': '2024-03-05'
+    })
+    assert response.status_code == 200
+    assert client.delete('/api/transactions/b', headers=headers).status_code == 200
+
+    create_budget(client, headers, 2024, 3, 100)
+    assert spent(db, user_id, 2024, 3) == 25
+
+
+def test_base_currency_change_reseeds(client, db):
+    user_id, headers = register(client)
+    post_expense(client, headers, '2024-07-01', 100, currency='EUR')
+    create_budget(client, headers, 2024, 7, 1000)
+    assert spent(db, user_id, 2024, 7) == 125
+
+    assert client.put('/api/auth/me', headers=headers, json={'base_currency': 'EUR'}).status_code == 200
+    assert spent(db, user_id, 2024, 7) == 100
+
+    post_expense(client, headers, '2024-07-02', 10)
+    assert spent(db, user_id, 2024, 7) == 110
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import date
+
+import server
+from tests.conftest import register
+
+
+def post_transaction(client, headers, day, description='Coffee shop', amount=4.5, **params):
+    return client.post('/api/transactions', headers=headers, params=params, json={
+        'type': 'expense', 'amount': amount, 'category': 'Food', 'description': description, 'date': day
+    })
+
+
+def test_recurring_occurrences_are_not_duplicates(client, db, fx, settings):
+    user_id, headers = register(client)
+    response = client.post('/api/recurring', headers=headers, json={
+        'type': 'expense', 'amount': 4.5, 'category': 'Food', 'description': 'Coffee shop',
+        'frequency': 'daily', 'start_date': '2024-01-01'
+    })
+    assert response.status_code == 200
+    assert asyncio.run(server.materialize_recurring(db, fx, settings.archive_dir, 500, today=date(2024, 2, 5))) == 36
+
+    assert client.get('/api/transactions/duplicates', headers=headers).json() == []
+
+    # A manual entry next to the occurrences is still paired with each of them
+    manual_id = post_transaction(client, headers, '2024-01-10', description='Coffee-shop').json()['id']
+    pairs = client.get('/api/transactions/duplicates', headers=headers, params={'days': 1}).json()
+    assert len(pairs) == 3
+    assert all(manual_id in {t['id'] for t in p['transactions']} for p in pairs)
+    # Only the occurrence on the same day shares the fingerprint
+    assert sum(p['exact'] for p in pairs) == 1
+
+
+def test_near_duplicates_and_reject(client):
+    user_id, headers = register(client)
+    first = post_transaction(client, headers, '2024-03-01', description='Grocery Store #12').json()
+    post_transaction(client, headers, '2024-03-03', description='grocery store 12')
+    post_transaction(client, headers, '2024-03-09', description='Grocery Store #12')  # outside the window
+    post_transaction(client, headers, '2024-03-01', description='Grocery Store #12', amount=5)
+
+    pairs = client.get('/api/transactions/duplicates', headers=headers).json()
+    assert len(pairs) == 1
+    assert pairs[0]['days_apart'] == 2
+    assert pairs[0]['exact'] is False
+
+    response = post_transaction(client, headers, '2024-03-01', description='grocery store #12', reject_duplicates=True)
+    assert response.status_code == 409
+    assert first['id'] in response.json()['detail']
+
+
+def test_backfill_runs_once(db):
+    async def run():
+        await db.users.insert_one({'id': 'u1', 'base_currency': 'EUR'})
+        await db.transactions.insert_one({
+            'id': 'legacy', 'user_id': 'u1', 'type': 'expense', 'amount': 12.3,
+            'category': 'Food', 'description': 'Old row', 'date': '2023-01-01'
+        })
+        await server.backfill_dedup_fields(db)
+        legacy = await db.transactions.find_one({'id': 'legacy'})
+
+        # Later starts skip the scan once the migration is recorded
+        await db.transactions.insert_one({'id': 'late', 'user_id': 'u1', 'amount': 1.0,
+                                          'description': 'x', 'date': '2023-01-02'})
+        await server.backfill_dedup_fields(db)
+        late = await db.transactions.find_one({'id': 'late'})
+        return legacy, late
+
+    legacy, late = asyncio.run(run())
+    assert legacy['currency'] == 'EUR'
+    assert legacy['amount_cents'] == 1230
+    assert len(legacy['fingerprint']) == 40
+    assert 'fingerprint' not in late
@@ -0,0 +1,135 @@
+import asyncio
+import bisect
+from datetime import date, timedelta
+
+import numpy as np
+
+import server
+from tests.conftest import register
+
+CURRENCIES = ['USD', 'EUR', 'GBP']
+FIRST_DATE = date(2023, 10, 1)  # before the first rate in the test table
+
+
+def reference_rate(fx, currency, day):
+    # Per-row as-of lookup, independent of the vectorized searchsorted path
+    if currency == server.FX_QUOTE_CURRENCY:
+        return 1.0
+    dates, rates = fx.rates[currency]
+    i = bisect.bisect_right(dates.tolist(), day) - 1
+    return float(rates[max(i, 0)])
+
+
+def reference_convert(fx, amount, currency, day, base_currency):
+    return amount * reference_rate(fx, base_currency, day) / reference_rate(fx, currency, day)
+
+
+def mixed_currency_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    amounts = np.round(rng.uniform(1, 500, n), 2)
+    currencies = rng.choice(CURRENCIES, n)
+    days = [FIRST_DATE + timedelta(days=int(d)) for d in rng.integers(0, 400, n)]
+    return amounts, currencies, days
+
+
+def test_as_of_lookups(fx):
+    dates = server.parse_dates(['2023-12-31', '2024-01-01', '2024-05-31', '2024-06-01', '2025-03-01'])
+    # Dates before the first rate use the first rate; later ones the latest on or before
+    assert fx.rates_for('EUR', dates).tolist() == [0.9, 0.9, 0.9, 0.8, 0.8]
+    assert server.to_base_currency(fx, 100, 'USD', '2024-07-01', 'EUR') == 80
+    assert server.to_base_currency(fx, 90, 'EUR', '2024-02-01', 'GBP') == 75
+
+
+def test_convert_matches_per_row_on_large_dataset(fx):
+    amounts, currencies, days = mixed_currency_rows(100_000)
+    dates = np.array(days, dtype='datetime64[D]')
+    for base_currency in CURRENCIES:
+        converted = fx.convert(amounts, currencies.astype(object), dates, base_currency)
+        expected = [
+            reference_convert(fx, a, c, d, base_currency)
+            for a, c, d in zip(amounts.tolist(), currencies.tolist(), days)
+        ]
+        np.testing.assert_allclose(converted, expected, rtol=1e-12)
+
+
+def test_default_rate_table(tmp_path, caplog):
+    fx = server.FxRates.load(server.DEFAULT_FX_RATES_PATH)
+    for currency in ['EUR', 'GBP', 'INR', 'JPY', 'CAD', 'AUD']:
+        assert fx.supports(currency)
+    assert 0 < server.to_base_currency(fx, 100, 'USD', '2024-07-01', 'EUR') < 100
+
+    # A missing file leaves only USD, loudly
+    missing = server.FxRates.load(tmp_path / 'missing.csv')
+    assert not missing.supports('EUR') and missing.supports('USD')
+    assert 'not found' in caplog.text
+
+
+def test_convert_marks_missing_currencies(fx):
+    converted = fx.convert(
+        np.array([10.0, 20.0, 30.0]),
+        np.array(['EUR', 'JPY', 'USD'], dtype=object),
+        server.parse_dates(['2024-07-01'] * 3),
+        'USD'
+    )
+    assert converted[0] == 12.5
+    assert np.isnan(converted[1])
+    assert converted[2] == 30
+    assert server.to_base_currency(fx, 20, 'JPY', '2024-07-01', 'USD') == 0
+
+
+def test_aggregate_in_base_matches_per_row(db, fx):
+    amounts, currencies, days = mixed_currency_rows(10_000, seed=1)
+    types = np.random.default_rng(2).choice(['income', 'expense'], len(amounts))
+    rows = [{
+        'id': str(i),
+        'user_id': 'u1',
+        'type': t,
+        'amount': a,
+        'currency': c,
+        'category': 'Food',
+        'description': 'row',
+        'date': d.isoformat()
+    } for i, (a, c, d, t) in enumerate(zip(amounts.tolist(), currencies.tolist(), days, types.tolist()))]
+    # Legacy rows without a currency count as the base currency
+    rows.append({'id': 'legacy', 'user_id': 'u1', 'type': 'expense', 'amount': 7.0,
+                 'category': 'Food', 'description': 'row', 'date': '2024-02-01'})
+    rows.append({'id': 'yen', 'user_id': 'u1', 'type': 'expense', 'amount': 1000.0, 'currency': 'JPY',
+                 'category': 'Food', 'description': 'row', 'date': '2024-02-01'})
+
+    async def run():
+        await db.transactions.insert_many([dict(r) for r in rows])
+        return await server.aggregate_in_base(db, fx, {'user_id': 'u1'}, ['type'], 'GBP')
+
+    groups, converted, unconverted = asyncio.run(run())
+    assert unconverted == ['JPY']
+
+    expected = {'income': 0.0, 'expense': 0.0}
+    for r in rows:
+        if r.get('currency') == 'JPY':
+            continue
+        day = date.fromisoformat(r['date'])
+        expected[r['type']] += reference_convert(fx, r['amount'], r.get('currency', 'GBP'), day, 'GBP')
+    totals = {'income': 0.0, 'expense': 0.0}
+    for g, amount in zip(groups, converted.tolist()):
+        totals[g['type']] += amount
+    np.testing.assert_allclose([totals['income'], totals['expense']], [expected['income'], expected['expense']], rtol=1e-9)
+
+
+def test_summary_reports_unconverted_currencies(client, db):
+    user_id, headers = register(client)
+    response = client.post('/api/transactions', headers=headers, json={
+        'type': 'expense', 'amount': 50, 'currency': 'EUR', 'category': 'Food',
+        'description': 'Dinner', 'date': '2024-07-01'
+    })
+    assert response.status_code == 200
+    # A row whose currency was later dropped from the rate file
+    asyncio.run(db.transactions.insert_one({
+        'id': 'yen', 'user_id': user_id, 'type': 'expense', 'amount': 1000.0, 'currency': 'JPY',
+        'category': 'Food', 'description': 'Sushi', 'date': '2024-07-02'
+    }))
+
+    response = client.get('/api/reports/summary', headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body['unconverted_currencies'] == ['JPY']
+    assert body['total_expense'] == 62.5
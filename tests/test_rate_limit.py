@@ -0,0 +1,115 @@
+import asyncio
+
+import server
+from tests.conftest import make_client, register
+
+
+def test_prune_keeps_drained_buckets_of_other_kinds():
+    limiter = server.MemoryRateLimiter(max_keys=10)
+
+    async def run():
+        # Auth buckets that refill almost instantly
+        for i in range(9):
+            await limiter.acquire(f'ip:10.0.0.{i}:auth', 1, 10, 1e9)
+        # A user bucket drained to 20/60 that refills slowly
+        await limiter.acquire('user:u1', 40, 60, 0.001)
+        # The 11th key triggers a prune from an auth request
+        await limiter.acquire('ip:10.0.0.9:auth', 1, 10, 1e9)
+
+    asyncio.run(run())
+    # Refilled auth buckets are dropped under their own capacity and rate,
+    # the drained user bucket is judged by its own and kept
+    assert list(limiter.buckets) == ['user:u1', 'ip:10.0.0.9:auth']
+    tokens, _, capacity, _ = limiter.buckets['user:u1']
+    assert capacity == 60 and 20 <= tokens < 21
+
+
+def test_prune_evicts_least_recently_used():
+    limiter = server.MemoryRateLimiter(max_keys=100)
+
+    async def run():
+        for i in range(101):
+            await limiter.acquire(f'ip:{i}', 5, 10, 0.001)
+
+    asyncio.run(run())
+    # Evicted down to 90% in one pass, oldest first
+    assert len(limiter.buckets) == 90
+    assert next(iter(limiter.buckets)) == 'ip:11'
+
+
+def rate_limited_client(settings, db, fx, **overrides):
+    settings = settings.model_copy(update={
+        'rate_limit_enabled': True,
+        'rate_limit_capacity': 10,
+        'rate_limit_refill_per_second': 0.001,
+        **overrides
+    })
+    return make_client(settings, db, fx)
+
+
+def test_user_bucket_and_route_costs(settings, db, fx):
+    client = rate_limited_client(settings, db, fx)
+    user_id, headers = register(client)
+
+    # The summary costs 5 of the user's 10 tokens
+    assert client.get('/api/reports/summary', headers=headers).status_code == 200
+    assert client.get('/api/reports/summary', headers=headers).status_code == 200
+    response = client.get('/api/transactions', headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+    # Another user and the health check are unaffected
+    other_id, other_headers = register(client, email='other@example.com')
+    assert client.get('/api/transactions', headers=other_headers).status_code == 200
+    assert client.get('/api/health').status_code == 200
+
+
+def test_auth_routes_are_limited_per_ip(settings, db, fx):
+    client = rate_limited_client(settings, db, fx, auth_rate_limit_capacity=2, auth_rate_limit_refill_per_second=0.001)
+    user_id, headers = register(client)
+    login = {'email': 'user@example.com', 'password': 'secret'}
+    assert client.post('/api/auth/login', json=login).status_code == 200
+    assert client.post('/api/auth/login', json=login).status_code == 429
+    # The user's own bucket is separate
+    assert client.get('/api/transactions', headers=headers).status_code == 200
+
+
+def test_sheds_load_past_concurrency_cap(settings, db, fx):
+    client = rate_limited_client(settings, db, fx, max_concurrent_requests=0)
+    response = client.get('/api/transactions')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert client.get('/api/health').status_code == 200
+
+
+def login_scope(peer, forwarded=None):
+    headers = [(b'x-forwarded-for', forwarded.encode())] if forwarded else []
+    return {'type': 'http', 'path': '/api/auth/login', 'client': (peer, 5000), 'headers': headers}
+
+
+def test_forwarded_ip_from_trusted_proxies(settings):
+    settings = settings.model_copy(update={
+        'auth_rate_limit_capacity': 1, 'auth_rate_limit_refill_per_second': 0.001,
+        'trusted_proxies': ['10.0.0.0/8']
+    })
+    middleware = server.RateLimitMiddleware(None, settings)
+
+    async def charge(peer, forwarded=None):
+        return await middleware.charge(login_scope(peer, forwarded), '/api/auth/login')
+
+    async def run():
+        # Behind the ingress, each client gets its own auth bucket
+        assert await charge('10.0.0.5', '203.0.113.7') == 0
+        assert await charge('10.0.0.6', '198.51.100.2, 10.1.2.3') == 0
+        assert await charge('10.0.0.5', '203.0.113.7') > 0
+        # A spoofed leftmost entry doesn't move the client to another bucket
+        assert await charge('10.0.0.5', '192.0.2.1, 203.0.113.7') > 0
+        # Untrusted peers are keyed by their own address, whatever they forward
+        assert await charge('198.51.100.9', '192.0.2.44') == 0
+        assert await charge('198.51.100.9', '192.0.2.45') > 0
+
+    asyncio.run(run())
+    assert 'ip:203.0.113.7:auth' in middleware.memory_limiter.buckets
+    assert 'ip:198.51.100.2:auth' in middleware.memory_limiter.buckets
+    assert 'ip:198.51.100.9:auth' in middleware.memory_limiter.buckets
+    assert 'ip:192.0.2.44:auth' not in middleware.memory_limiter.buckets
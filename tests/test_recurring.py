@@ -0,0 +1,115 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import server
+from tests.conftest import register
+
+
+@pytest.fixture(autouse=True)
+def indexes(db):
+    # The idempotency key; sparse rather than the partial index ensure_indexes()
+    # builds, since mongomock ignores partialFilterExpression
+    asyncio.run(db.transactions.create_index('recurrence_key', unique=True, sparse=True))
+
+
+def create_rule(client, headers, **fields):
+    rule = {
+        'type': 'expense', 'amount': 20, 'category': 'Bills', 'description': 'Subscription',
+        'frequency': 'monthly', 'start_date': '2024-01-31', **fields
+    }
+    response = client.post('/api/recurring', headers=headers, json=rule)
+    assert response.status_code == 200, response.text
+    return response.json()['id']
+
+
+def occurrence_dates(db, rule_id):
+    rows = asyncio.run(db.transactions.find({'recurring_rule_id': rule_id}).sort('date', 1).to_list(None))
+    return [r['date'] for r in rows]
+
+
+def get_rule(db, rule_id):
+    return asyncio.run(db.recurring_rules.find_one({'id': rule_id}))
+
+
+def materialize(db, fx, settings, today, batch_size=3):
+    return asyncio.run(server.materialize_recurring(db, fx, settings.archive_dir, batch_size, today=today))
+
+
+def test_monthly_rule_clamps_to_short_months(client, db, fx, settings):
+    user_id, headers = register(client)
+    rule_id = create_rule(client, headers)
+
+    # Catch-up after downtime: every missed occurrence in one pass, across batches
+    assert materialize(db, fx, settings, date(2024, 5, 15)) == 4
+    assert occurrence_dates(db, rule_id) == ['2024-01-31', '2024-02-29', '2024-03-31', '2024-04-30']
+    assert get_rule(db, rule_id)['next_run'] == '2024-05-31'
+
+
+def test_replay_is_idempotent(client, db, fx, settings):
+    user_id, headers = register(client)
+    rule_id = create_rule(client, headers, frequency='daily', start_date='2024-03-01')
+
+    assert materialize(db, fx, settings, date(2024, 3, 10)) == 10
+    # Running again for the same day inserts nothing
+    assert materialize(db, fx, settings, date(2024, 3, 10)) == 0
+
+    # A crash between storing occurrences and advancing the rule replays the batch
+    asyncio.run(db.recurring_rules.update_one({'id': rule_id}, {'$set': {'next_run': '2024-03-01'}}))
+    assert materialize(db, fx, settings, date(2024, 3, 10)) == 0
+    assert len(occurrence_dates(db, rule_id)) == 10
+    assert get_rule(db, rule_id)['next_run'] == '2024-03-11'
+
+    # Budget totals count each occurrence once
+    totals = asyncio.run(db.budget_totals.find_one({'user_id': user_id, 'year': 2024, 'month': 3, 'category': 'Bills'}))
+    assert totals['spent'] == 200
+
+
+def test_end_date_deactivates_rule(client, db, fx, settings):
+    user_id, headers = register(client)
+    rule_id = create_rule(client, headers, frequency='weekly', interval=2, start_date='2024-01-01', end_date='2024-02-10')
+
+    assert materialize(db, fx, settings, date(2024, 6, 1)) == 3
+    assert occurrence_dates(db, rule_id) == ['2024-01-01', '2024-01-15', '2024-01-29']
+    rule = get_rule(db, rule_id)
+    assert rule['active'] is False
+    assert materialize(db, fx, settings, date(2024, 7, 1)) == 0
+
+
+def test_future_rules_wait(client, db, fx, settings):
+    user_id, headers = register(client)
+    rule_id = create_rule(client, headers, start_date='2024-06-15')
+    assert materialize(db, fx, settings, date(2024, 6, 14)) == 0
+    assert materialize(db, fx, settings, date(2024, 6, 15)) == 1
+    assert get_rule(db, rule_id)['next_run'] == '2024-07-15'
+
+
+def test_backdated_rule_is_flushed_in_batches(client, db, fx, settings, monkeypatch):
+    user_id, headers = register(client)
+    rule_id = create_rule(client, headers, frequency='daily', start_date='2023-01-01')
+
+    flush = server.flush_recurring_batch
+    batches, crash_at = [], [3]
+
+    async def recording_flush(db, fx, archive_dir, docs, rule_updates):
+        batches.append(len(docs))
+        if len(batches) in crash_at:
+            raise RuntimeError('worker died')
+        return await flush(db, fx, archive_dir, docs, rule_updates)
+
+    # Memory stays bounded by the batch size, and a crash keeps stored batches
+    monkeypatch.setattr(server, 'flush_recurring_batch', recording_flush)
+    with pytest.raises(RuntimeError):
+        materialize(db, fx, settings, date(2024, 12, 31), batch_size=50)
+    assert batches == [50, 50, 50]
+    assert get_rule(db, rule_id)['next_run'] == '2023-04-11'
+
+    # The next run resumes after the stored occurrences
+    batches.clear()
+    crash_at.clear()
+    assert materialize(db, fx, settings, date(2024, 12, 31), batch_size=50) == 631
+    assert max(batches) == 50 and sum(batches) == 631
+    dates = occurrence_dates(db, rule_id)
+    assert len(dates) == len(set(dates)) == 731
+    assert get_rule(db, rule_id)['next_run'] == '2025-01-01'